@@ -0,0 +1,384 @@
+#############################################################################
+# MIT License
+
+# Copyright (c) 2023-2024 Chris Urffer
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#############################################################################
+
+
+# Benchmarks for the simulation and render paths. Results are written as
+# JSON so runs from different builds can be compared.
+#
+#   python -m benchmarks.bench --output results.json
+#   python -m benchmarks.bench --quick --only tick
+
+import argparse
+import json
+import os
+import pickle
+import platform
+import queue
+import statistics
+import subprocess
+import sys
+import time
+from typing import Any, Callable, Optional
+
+import numpy as np
+
+from pytrees.environment import CollisionMode, Environment
+from pytrees.state import PyTreesState
+from pytrees.tree import Tree
+from pytrees.utils import Pos
+
+
+class BenchConfig:
+
+    def __init__(
+        self,
+        width: int = Environment.WIDTH,
+        num_trees: int = Environment.NUM_TREES_STARTING,
+        particles_per_tick: int = Environment.NUM_PARTICLES_PER_TICK,
+        collision_mode: CollisionMode = CollisionMode.STEPPED,
+    ) -> None:
+        self.width = width
+        self.num_trees = num_trees
+        self.particles_per_tick = particles_per_tick
+        self.collision_mode = collision_mode
+
+    def params(self) -> dict[str, Any]:
+        return {
+            "width": self.width,
+            "num_trees": self.num_trees,
+            "particles_per_tick": self.particles_per_tick,
+            "collision_mode": self.collision_mode.value,
+        }
+
+    def environment(
+        self,
+        seed: int = 0,
+    ) -> Environment:
+        return Environment.with_params(
+            {
+                "WIDTH": self.width,
+                "NUM_TREES_STARTING": self.num_trees,
+                "NUM_PARTICLES_PER_TICK": self.particles_per_tick,
+            },
+            collision_mode=self.collision_mode,
+            seed=seed,
+        )
+
+
+def configs(quick: bool) -> list[BenchConfig]:
+    # Vary one parameter at a time around the defaults, to show how each
+    # path scales with it
+    if quick:
+        return [
+            BenchConfig(collision_mode=mode)
+            for mode in CollisionMode
+        ]
+    ret: list[BenchConfig] = []
+    for mode in CollisionMode:
+        ret += [BenchConfig(width=width, collision_mode=mode) for width in (1500, 3000, 6000, 12000)]
+        ret += [BenchConfig(num_trees=num_trees, collision_mode=mode) for num_trees in (50, 800)]
+        ret += [BenchConfig(particles_per_tick=rate, collision_mode=mode) for rate in (8, 32)]
+    return ret
+
+
+def measure(
+    func: Callable[[], Any],
+    repeats: int,
+    setup: Optional[Callable[[], Any]] = None,
+) -> dict[str, Any]:
+    # Time func() repeats times. If setup is given, it is called untimed
+    # before each run and its result is passed to func.
+    times: list[float] = []
+    for _ in range(repeats):
+        if setup is not None:
+            arg = setup()
+            time_start = time.perf_counter()
+            func(arg)
+        else:
+            time_start = time.perf_counter()
+            func()
+        times.append(time.perf_counter() - time_start)
+    return {
+        "repeats": repeats,
+        "min": min(times),
+        "median": statistics.median(times),
+        "mean": statistics.fmean(times),
+        "max": max(times),
+    }
+
+
+def bench_environment_init(
+    config: BenchConfig,
+    repeats: int,
+) -> dict[str, Any]:
+    seeds = iter(range(repeats))
+    return measure(lambda: config.environment(next(seeds)), repeats)
+
+
+def bench_tick(
+    config: BenchConfig,
+    repeats: int,
+    num_ticks: int = 100,
+) -> dict[str, Any]:
+    environment = config.environment()
+
+    def run() -> None:
+        for _ in range(num_ticks):
+            environment.tick()
+
+    result = measure(run, repeats)
+    result["per_tick"] = result["median"] / num_ticks
+    result["live_particles"] = len(environment._particles)
+    return result
+
+
+def bench_collide_trees(
+    config: BenchConfig,
+    repeats: int,
+) -> dict[str, Any]:
+    # Only meaningful for stepped collisions; each run tests the current
+    # particle field against every tree without consuming it
+    environment = config.environment()
+    alive = environment._particles.alive.copy()
+    energies = [tree._energy for tree in environment._trees]
+
+    def restore() -> None:
+        environment._particles.alive[:] = alive
+        for tree, energy in zip(environment._trees, energies):
+            tree._energy = energy
+
+    result = measure(
+        lambda _: environment._collide_particles_with_trees(),
+        repeats,
+        setup=restore,
+    )
+    result["live_particles"] = len(environment._particles)
+    return result
+
+
+def bench_tree_init(
+    config: BenchConfig,
+    repeats: int,
+    num_trees: int = 200,
+) -> dict[str, Any]:
+    environment = config.environment()
+
+    def run() -> None:
+        for _ in range(num_trees):
+            Tree(Pos(0, 500), rng=environment._tree_rng)
+
+    result = measure(run, repeats)
+    result["per_tree"] = result["median"] / num_trees
+    return result
+
+
+def bench_mutate(
+    config: BenchConfig,
+    repeats: int,
+) -> dict[str, Any]:
+    environment = config.environment()
+
+    def run() -> None:
+        for tree in environment._trees:
+            tree._root_node.mutate()
+            tree.solve()
+
+    result = measure(run, repeats)
+    result["per_tree"] = result["median"] / len(environment._trees)
+    result["mean_nodes"] = statistics.fmean(len(tree._nodes) for tree in environment._trees)
+    return result
+
+
+def bench_reindex_tree(
+    config: BenchConfig,
+    repeats: int,
+    num_trees: int = 20,
+) -> dict[str, Any]:
+    # Re-index single mutated trees in the collision grid, each followed by
+    # a query so the grid update is paid for as it would be in a tick
+    environment = config.environment()
+    for tree in environment._trees:
+        tree._root_node.mutate()
+        tree.solve()
+    probe = np.zeros(1, dtype=np.int64)
+    indices = iter(range(repeats * num_trees))
+
+    def run() -> None:
+        for _ in range(num_trees):
+            environment._index_tree(next(indices) % len(environment._trees))
+            environment._node_grid.query(probe, probe)
+
+    result = measure(run, repeats)
+    result["per_tree"] = result["median"] / num_trees
+    result["num_nodes"] = sum(len(tree._nodes) for tree in environment._trees)
+    return result
+
+
+def bench_pickle_state(
+    config: BenchConfig,
+    repeats: int,
+) -> dict[str, Any]:
+    state = PyTreesState.__new__(PyTreesState)
+    state.environment = config.environment()
+    state.ticking = True
+
+    result = measure(lambda: pickle.dumps(state), repeats)
+    result["bytes"] = len(pickle.dumps(state))
+    return result
+
+
+def bench_publish(
+    config: BenchConfig,
+    repeats: int,
+) -> dict[str, Any]:
+    from pytrees.transport import FramePublisher
+
+    environment = config.environment()
+    publisher = FramePublisher(queue.Queue())
+    try:
+        return measure(lambda: publisher.publish(environment), repeats)
+    finally:
+        publisher.close()
+
+
+def bench_draw(
+    config: BenchConfig,
+    repeats: int,
+) -> dict[str, Any]:
+    # Render into an offscreen surface through SDL's dummy video driver
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    from pytrees.display import PyTreesDisplay
+    from pytrees.transport import FramePublisher, FrameReader
+
+    environment = config.environment()
+    control_queue: queue.Queue[tuple] = queue.Queue()
+    publisher = FramePublisher(control_queue)
+    reader = FrameReader(control_queue)
+    try:
+        publisher.publish(environment)
+        frame = reader.poll()
+        assert reader.static is not None and frame is not None
+        display = PyTreesDisplay()
+        return measure(lambda: display.draw(reader.static, frame), repeats)
+    finally:
+        reader.close()
+        publisher.close()
+
+
+BENCHMARKS: dict[str, Callable[[BenchConfig, int], dict[str, Any]]] = {
+    "environment_init": bench_environment_init,
+    "tick": bench_tick,
+    "collide_trees": bench_collide_trees,
+    "tree_init": bench_tree_init,
+    "mutate": bench_mutate,
+    "reindex_tree": bench_reindex_tree,
+    "pickle_state": bench_pickle_state,
+    "publish": bench_publish,
+    "draw": bench_draw,
+}
+
+# Benchmarks that don't depend on every config axis only run once per value
+# of the axes they do depend on
+_AXES: dict[str, tuple[str, ...]] = {
+    "collide_trees": ("width", "num_trees", "particles_per_tick"),
+    "tree_init": (),
+    "mutate": ("num_trees",),
+    "reindex_tree": ("width", "num_trees"),
+}
+
+
+def metadata() -> dict[str, Any]:
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "commit": commit,
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": sys.version.split()[0],
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def run(
+    names: list[str],
+    quick: bool,
+    repeats: int,
+) -> dict[str, Any]:
+    results: list[dict[str, Any]] = []
+    for name in names:
+        seen: set[tuple] = set()
+        for config in configs(quick):
+            params = config.params()
+            axes = _AXES.get(name)
+            if axes is not None:
+                key = tuple(params[axis] for axis in axes)
+                if key in seen:
+                    continue
+                seen.add(key)
+            result = BENCHMARKS[name](config, repeats)
+            results.append({"benchmark": name, "params": params, **result})
+            print(f"{name} {params}: median {result['median']*1000:.2f} ms", file=sys.stderr)
+    return {"metadata": metadata(), "results": results}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark PyTrees")
+    parser.add_argument(
+        "--only",
+        action="append",
+        choices=list(BENCHMARKS),
+        help="benchmark to run; may be given more than once (default: all)",
+    )
+    parser.add_argument(
+        "--quick",
+        action="store_true",
+        help="only benchmark the default world size, tree count and spawn rate",
+    )
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument(
+        "--output",
+        default=None,
+        help="file to write JSON results to (default: stdout)",
+    )
+    args = parser.parse_args()
+
+    results = run(args.only or list(BENCHMARKS), args.quick, args.repeats)
+    if args.output is None:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+    else:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
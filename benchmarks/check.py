@@ -0,0 +1,187 @@
+#############################################################################
+# MIT License
+
+# Copyright (c) 2023-2024 Chris Urffer
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#############################################################################
+
+
+# Regression checks for results that must match exactly between code paths:
+# stepped and analytic collisions, a run and its restored checkpoint or
+# unpickled copy, and the computed warmup and ticking through it. Exits with
+# a non-zero status if any check fails.
+#
+#   python -m benchmarks.check --seeds 0 1 2
+
+import argparse
+import os
+import pickle
+import sys
+import tempfile
+from typing import Any, Callable
+
+from pytrees.checkpoint import load_environment, save_environment
+from pytrees.environment import CollisionMode, Environment
+
+
+NUM_TICKS = 600
+NUM_TREES = 80
+NUM_WARMUP_TICKS = 300
+
+# Tick on which every MUTATE_EVERY-th tree is mutated
+MUTATE_TICK = 300
+MUTATE_EVERY = 7
+
+
+def environment(
+    collision_mode: CollisionMode,
+    seed: int,
+    **params: Any,
+) -> Environment:
+    return Environment.with_params(
+        {
+            "NUM_TREES_STARTING": NUM_TREES,
+            "NUM_WARMUP_TICKS": NUM_WARMUP_TICKS,
+            **params,
+        },
+        collision_mode=collision_mode,
+        seed=seed,
+    )
+
+
+def run(
+    environment: Environment,
+    first_tick: int,
+    last_tick: int,
+) -> None:
+    # Tick from first_tick up to last_tick, mutating trees mid-run
+    for tick in range(first_tick, last_tick):
+        environment.tick()
+        if tick == MUTATE_TICK:
+            for tree in environment._trees[::MUTATE_EVERY]:
+                tree._root_node.mutate()
+
+
+def state(
+    environment: Environment,
+) -> tuple:
+    # Everything compared between runs
+    particles = environment.particles
+    return (
+        environment._num_ticks,
+        [tree._energy for tree in environment._trees],
+        [tree.genome().sizes.tolist() for tree in environment._trees],
+        particles.ids.tolist(),
+        particles.xs.tolist(),
+        particles.ys.tolist(),
+        particles.powers.tolist(),
+        particles.types.tolist(),
+    )
+
+
+def check_collision_modes(
+    seed: int,
+) -> bool:
+    results = []
+    for collision_mode in CollisionMode:
+        env = environment(collision_mode, seed)
+        run(env, 0, NUM_TICKS)
+        results.append(state(env))
+    return all(result == results[0] for result in results)
+
+
+def check_checkpoint(
+    seed: int,
+) -> bool:
+    # A restored checkpoint carries on exactly like the run it was taken from
+    ok = True
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "check.ck")
+        for collision_mode in CollisionMode:
+            env = environment(collision_mode, seed)
+            run(env, 0, NUM_TICKS // 3)
+            save_environment(env, path)
+            run(env, NUM_TICKS // 3, NUM_TICKS)
+            restored = load_environment(path)
+            run(restored, NUM_TICKS // 3, NUM_TICKS)
+            ok = ok and state(env) == state(restored)
+    return ok
+
+
+def check_pickle(
+    seed: int,
+) -> bool:
+    ok = True
+    for collision_mode in CollisionMode:
+        env = environment(collision_mode, seed)
+        run(env, 0, NUM_TICKS // 3)
+        copy = pickle.loads(pickle.dumps(env))
+        run(env, NUM_TICKS // 3, NUM_TICKS)
+        run(copy, NUM_TICKS // 3, NUM_TICKS)
+        ok = ok and state(env) == state(copy)
+    return ok
+
+
+def check_warmup(
+    seed: int,
+) -> bool:
+    # The computed warmup matches ticking through it with no trees
+    ok = True
+    for collision_mode in CollisionMode:
+        warmed = environment(collision_mode, seed, NUM_TREES_STARTING=0)
+        ticked = environment(collision_mode, seed, NUM_TREES_STARTING=0, NUM_WARMUP_TICKS=0)
+        run(ticked, 0, NUM_WARMUP_TICKS)
+        ok = ok and state(warmed) == state(ticked)
+        run(warmed, 0, NUM_TICKS)
+        run(ticked, 0, NUM_TICKS)
+        ok = ok and state(warmed) == state(ticked)
+    return ok
+
+
+CHECKS: dict[str, Callable[[int], bool]] = {
+    "collision_modes": check_collision_modes,
+    "checkpoint": check_checkpoint,
+    "pickle": check_pickle,
+    "warmup": check_warmup,
+}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Check that PyTrees code paths agree exactly")
+    parser.add_argument("--seeds", type=int, nargs="+", default=[0, 1, 2])
+    parser.add_argument(
+        "--only",
+        action="append",
+        choices=list(CHECKS),
+        help="run only these checks (repeatable)",
+    )
+    args = parser.parse_args()
+
+    failed = False
+    for name in args.only or CHECKS:
+        for seed in args.seeds:
+            ok = CHECKS[name](seed)
+            failed = failed or not ok
+            print(f"{name} seed={seed}: {'ok' if ok else 'MISMATCH'}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,187 @@
+#############################################################################
+# MIT License
+
+# Copyright (c) 2023-2024 Chris Urffer
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#############################################################################
+
+
+# Microbenchmarks for the geometry value types in pytrees.utils. Compares the
+# slotted, immutable Pos with the dict-backed Pos it replaced, both in memory
+# per instance and in the hot loops that used to allocate one Pos per step.
+#
+#   python -m benchmarks.values --output values.json
+
+import argparse
+import json
+import sys
+import tracemalloc
+from typing import Any, Callable
+
+from benchmarks.bench import BenchConfig, measure, metadata
+from pytrees.utils import Pos
+
+
+class _DictPos:
+
+    # The previous Pos: one instance __dict__ per object, mutable, hashed
+    # through its repr
+
+    def __init__(
+        self,
+        x: int,
+        y: int,
+    ) -> None:
+        self.x = x
+        self.y = y
+
+    def __sub__(self, __value: '_DictPos') -> '_DictPos':
+        return _DictPos(self.x - __value.x, self.y - __value.y)
+
+    def __hash__(self) -> int:
+        return hash(repr(self))
+
+    def __repr__(self) -> str:
+        return f"({self.x},{self.y})"
+
+    def tuple(self) -> tuple[int, int]:
+        return (self.x, self.y)
+
+
+def _allocated_bytes(
+    build: Callable[[], Any],
+) -> int:
+    # Bytes still allocated by build()'s result once it returns
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        result = build()
+        allocated = tracemalloc.get_traced_memory()[0] - before
+    finally:
+        tracemalloc.stop()
+    del result
+    return allocated
+
+
+def _peak_bytes(
+    func: Callable[[], Any],
+) -> int:
+    # Most bytes allocated at once while func() runs, temporaries included
+    tracemalloc.start()
+    try:
+        func()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return peak
+
+
+def bench_instance_size(
+    repeats: int,
+    count: int = 100_000,
+) -> dict[str, Any]:
+    return {
+        "count": count,
+        "bytes_per_pos": _allocated_bytes(lambda: [Pos(i, i) for i in range(count)]) / count,
+        "bytes_per_dict_pos": _allocated_bytes(lambda: [_DictPos(i, i) for i in range(count)]) / count,
+    }
+
+
+def bench_hash(
+    repeats: int,
+    count: int = 100_000,
+) -> dict[str, Any]:
+    positions = [Pos(i, -i) for i in range(count)]
+    dict_positions = [_DictPos(i, -i) for i in range(count)]
+    return {
+        "count": count,
+        "pos": measure(lambda: set(positions), repeats),
+        "dict_pos": measure(lambda: set(dict_positions), repeats),
+    }
+
+
+def bench_screen_offsets(
+    repeats: int,
+) -> dict[str, Any]:
+    # Converting one world row to screen coordinates, as draw_landscape does
+    # once per column every frame
+    environment = BenchConfig().environment()
+    levels = environment._landscape._ground_levels.tolist()
+    offset = Pos(100, 50)
+    dict_offset = _DictPos(100, 50)
+
+    def with_dict_pos() -> list[tuple[int, int]]:
+        return [(_DictPos(i, level) - dict_offset).tuple() for i, level in enumerate(levels)]
+
+    def with_pos() -> list[tuple[int, int]]:
+        return [(Pos(i, level) - offset).tuple() for i, level in enumerate(levels)]
+
+    def with_ints() -> list[tuple[int, int]]:
+        offset_x, offset_y = offset.tuple()
+        return [(i - offset_x, level - offset_y) for i, level in enumerate(levels)]
+
+    variants = {"dict_pos": with_dict_pos, "pos": with_pos, "ints": with_ints}
+    return {
+        "columns": len(levels),
+        **{name: measure(func, repeats) for name, func in variants.items()},
+        "peak_bytes": {name: _peak_bytes(func) for name, func in variants.items()},
+    }
+
+
+BENCHMARKS: dict[str, Callable[[int], dict[str, Any]]] = {
+    "instance_size": bench_instance_size,
+    "hash": bench_hash,
+    "screen_offsets": bench_screen_offsets,
+}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark PyTrees geometry value types")
+    parser.add_argument(
+        "--only",
+        action="append",
+        choices=list(BENCHMARKS),
+        help="benchmark to run; may be given more than once (default: all)",
+    )
+    parser.add_argument("--repeats", type=int, default=20)
+    parser.add_argument(
+        "--output",
+        default=None,
+        help="file to write JSON results to (default: stdout)",
+    )
+    args = parser.parse_args()
+
+    results = {
+        "metadata": metadata(),
+        "results": [
+            {"benchmark": name, **BENCHMARKS[name](args.repeats)}
+            for name in args.only or list(BENCHMARKS)
+        ],
+    }
+    if args.output is None:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+    else:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
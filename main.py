@@ -23,76 +23,112 @@
 #############################################################################
 
 
+import argparse
 import multiprocessing
 import queue
 import time
-from typing import Optional
+
+import pygame
 
 from pytrees.display import PyTreesDisplay, PyTreesEvent
+from pytrees.scheduler import RenderScheduler
 from pytrees.state import PyTreesState
+from pytrees.transport import FramePublisher, FrameReader
 
 
 def thread_visualize(
-    input_queue: "multiprocessing.Queue[PyTreesState]",
+    control_queue: "multiprocessing.Queue[tuple]",
     output_queue: "multiprocessing.Queue[PyTreesEvent]",
+    target_fps: int = RenderScheduler.TARGET_FPS,
 ) -> None:
     display = PyTreesDisplay()
-    state: Optional[PyTreesState] = None
+    reader = FrameReader(control_queue)
+    scheduler = RenderScheduler(target_fps)
     while True:
-        try:
-            state = input_queue.get(block=False)
-        except queue.Empty:
-            pass
+        reader.poll()
 
         try:
-            if state is not None:
-                display.draw(state)
-                events = display.process_events(state)
+            if reader.static is not None and reader.frame is not None:
+                events = display.process_events(reader.frame)
                 for event in events:
                     output_queue.put_nowait(event)
-            display.update()
+                if scheduler.should_draw(reader.frame.version, display.needs_redraw):
+                    display.draw(reader.static, reader.frame)
+                    display.update()
+                    scheduler.drawn()
+            else:
+                pygame.event.pump()
         except Exception as e:
             print(f"Renderer exiting: {e}")
+            reader.close()
             raise
-        # time.sleep(0.05)  # 20 FPS cap
+        scheduler.wait()
 
 
 def main():
+    parser = argparse.ArgumentParser(description="Run PyTrees with a pygame window")
+    parser.add_argument(
+        "--fps",
+        type=int,
+        default=RenderScheduler.TARGET_FPS,
+        help="most frames the window draws per second",
+    )
+    parser.add_argument(
+        "--publish-fps",
+        type=float,
+        default=None,
+        help="most frames the simulation publishes per second (default: same as --fps)",
+    )
+    parser.add_argument(
+        "--fast-forward",
+        action="store_true",
+        help="start without publishing frames; press t in the window to toggle",
+    )
+    args = parser.parse_args()
+
     state = PyTreesState()
+    state.fast_forward = args.fast_forward
 
-    # Create a queue to push the state onto every tick
-    window_input_queue: multiprocessing.Queue[PyTreesState] = multiprocessing.Queue(1)
+    # Frames are published through shared memory; the queue only carries
+    # static data and shared memory segment names
+    window_control_queue: multiprocessing.Queue[tuple] = multiprocessing.Queue()
     window_output_queue: multiprocessing.Queue[PyTreesEvent] = multiprocessing.Queue(20)
+    publisher = FramePublisher(
+        window_control_queue,
+        max_fps=args.publish_fps or args.fps,
+    )
 
     # Create a new thread for rendering
     visualization_process = multiprocessing.Process(
         target=thread_visualize,
-        args=[window_input_queue, window_output_queue],
+        args=[window_control_queue, window_output_queue, args.fps],
     )
     visualization_process.start()
 
     # Continually tick the state
     time_curr = time.time()
     num_ticks_this_sec = 0
-    while visualization_process.is_alive():
-        state.tick()
-        try:
+    try:
+        while visualization_process.is_alive():
+            state.tick()
             while True:
                 try:
                     event = window_output_queue.get(block=False)
-                    state.process_event(event)
                 except queue.Empty:
                     break
-
-            window_input_queue.put_nowait(state)
-        except Exception:
-            pass
-        tick_end = time.time()
-        num_ticks_this_sec += 1
-        if tick_end - time_curr >= 1:
-            print(f"{num_ticks_this_sec} ticks in {tick_end - time_curr} sec")
-            num_ticks_this_sec = 0
-            time_curr = tick_end
+                state.process_event(event)
+
+            # Frames are only published when the renderer is ready for one
+            if not state.fast_forward:
+                publisher.maybe_publish(state.environment)
+            tick_end = time.time()
+            num_ticks_this_sec += 1
+            if tick_end - time_curr >= 1:
+                print(f"{num_ticks_this_sec} ticks in {tick_end - time_curr} sec")
+                num_ticks_this_sec = 0
+                time_curr = tick_end
+    finally:
+        publisher.close()
 
 
 if __name__ == '__main__':
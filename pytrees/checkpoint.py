@@ -0,0 +1,321 @@
+#############################################################################
+# MIT License
+
+# Copyright (c) 2023-2024 Chris Urffer
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#############################################################################
+
+
+# Binary checkpoints of a whole Environment. A checkpoint is a small JSON
+# header followed by raw, aligned numpy arrays:
+#
+#   magic (8 bytes) | format version (u32) | reserved (u32) |
+#   header length (u64) | JSON header | padding | arrays...
+#
+# The header holds scalars and, for every array, its dtype, shape and byte
+# offset from the first aligned byte after the header. The landscape is stored as the
+# parameters it is generated from, and trees as their genomes concatenated
+# into flat arrays.
+
+import json
+import mmap
+import os
+import struct
+from typing import Any, Optional
+
+import numpy as np
+
+from pytrees.environment import CollisionMode, Environment, Landscape
+from pytrees.genome import TreeGenome
+from pytrees.instrumentation import TickStats
+from pytrees.mutation import MutationConfig
+from pytrees.particles import AbsorptionQueue, ParticleStore
+from pytrees.rng import RandomStream
+from pytrees.spatial import NodeGrid
+from pytrees.tree import Tree
+from pytrees.utils import Dims, Pos
+
+
+MAGIC = b"PYTREECK"
+FORMAT_VERSION = 1
+
+_PREFIX = struct.Struct("<8sIIQ")
+_ALIGNMENT = 64
+
+# Environment parameters that can be shadowed per instance
+_PARAMS = (
+    "WIDTH",
+    "HEIGHT",
+    "NUM_TREES_STARTING",
+    "NUM_WARMUP_TICKS",
+    "NUM_PARTICLES_PER_TICK",
+)
+
+# Random streams of an Environment, by attribute name
+_STREAMS = ("_rng", "_landscape_rng", "_particle_rng", "_tree_rng")
+
+_GENOME_FIELDS = ("parents", "types", "angles", "dists", "sizes")
+
+
+class CheckpointError(Exception):
+    pass
+
+
+def _align(offset: int) -> int:
+    return -(-offset // _ALIGNMENT) * _ALIGNMENT
+
+
+def write_checkpoint(
+    path: str,
+    meta: dict[str, Any],
+    arrays: dict[str, np.ndarray],
+) -> None:
+    # Array offsets are relative to the first aligned byte after the header
+    layout: dict[str, dict[str, Any]] = {}
+    offset = 0
+    for name, array in arrays.items():
+        layout[name] = {
+            "dtype": array.dtype.str,
+            "shape": list(array.shape),
+            "offset": offset,
+        }
+        offset = _align(offset + array.nbytes)
+    header = json.dumps({"meta": meta, "arrays": layout}).encode()
+    data_start = _align(_PREFIX.size + len(header))
+
+    # Write to a temporary file first, so an interrupted write never
+    # replaces a good checkpoint. The name is per process, so concurrent
+    # writers of the same file don't clobber each other's partial writes.
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, "wb") as f:
+        f.write(_PREFIX.pack(MAGIC, FORMAT_VERSION, 0, len(header)))
+        f.write(header)
+        for name, array in arrays.items():
+            f.write(b"\0" * (data_start + layout[name]["offset"] - f.tell()))
+            f.write(np.ascontiguousarray(array).data.cast("B"))
+    os.replace(temp_path, path)
+
+
+class CheckpointReader:
+
+    # Reads a checkpoint through a memory map. Only the header is parsed up
+    # front; arrays are views onto the mapped file and are paged in as they
+    # are used.
+
+    def __init__(
+        self,
+        path: str,
+    ) -> None:
+        self._file = open(path, "rb")
+        try:
+            magic, version, _, header_size = _PREFIX.unpack(self._file.read(_PREFIX.size))
+            if magic != MAGIC:
+                raise CheckpointError(f"{path} is not a PyTrees checkpoint")
+            if version != FORMAT_VERSION:
+                raise CheckpointError(
+                    f"{path} has checkpoint format {version}, expected {FORMAT_VERSION}"
+                )
+            header = json.loads(self._file.read(header_size))
+            self._data_start = _align(_PREFIX.size + header_size)
+            self._map: Optional[mmap.mmap] = mmap.mmap(
+                self._file.fileno(), 0, access=mmap.ACCESS_READ,
+            )
+        except Exception:
+            self._file.close()
+            raise
+        self.meta: dict[str, Any] = header["meta"]
+        self._layout: dict[str, dict[str, Any]] = header["arrays"]
+
+    def __enter__(self) -> "CheckpointReader":
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.close()
+
+    def __contains__(
+        self,
+        name: str,
+    ) -> bool:
+        return name in self._layout
+
+    def names(self) -> list[str]:
+        return list(self._layout)
+
+    def array(
+        self,
+        name: str,
+    ) -> np.ndarray:
+        # Read-only view onto the mapped file. Copy it if it needs to
+        # outlive the reader.
+        if self._map is None:
+            raise CheckpointError("checkpoint reader is closed")
+        entry = self._layout[name]
+        return np.ndarray(
+            tuple(entry["shape"]),
+            dtype=np.dtype(entry["dtype"]),
+            buffer=self._map,
+            offset=self._data_start + entry["offset"],
+        )
+
+    def close(self) -> None:
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        self._file.close()
+
+
+def save_environment(
+    environment: Environment,
+    path: str,
+) -> None:
+    landscape = environment._landscape
+    particles = environment.particles
+    trees = environment._trees
+
+    meta: dict[str, Any] = {
+        "params": {name: getattr(environment, name) for name in _PARAMS},
+        "collision_mode": environment._collision_mode.value,
+        "num_ticks": environment._num_ticks,
+        "landscape": {
+            "ground_baseline": landscape._ground_baseline,
+            "ground_freqs": list(landscape._ground_freqs),
+            "ground_amps": list(landscape._ground_amps),
+            "ground_disps": list(landscape._ground_disps),
+        },
+        "mutation": environment._mutation.as_dict(),
+        "next_particle_id": particles._next_id,
+        "streams": {},
+    }
+
+    arrays: dict[str, np.ndarray] = {}
+
+    # Random streams; their buffers are arrays, the rest is small
+    for name in _STREAMS:
+        state = getattr(environment, name).get_state()
+        arrays[f"stream{name}_buffer"] = state.pop("buffer")
+        meta["streams"][name] = state
+
+    # Particles, as the live portion of each column
+    for column in ParticleStore._COLUMNS:
+        arrays[f"particles{column}"] = getattr(particles, column)[:len(particles)]
+
+    # Trees, with their genomes concatenated in tree order
+    genomes = [tree.genome() for tree in trees]
+    arrays["tree_num_nodes"] = np.array([len(genome) for genome in genomes], dtype=np.int64)
+    arrays["tree_roots"] = np.array(
+        [tree._root_node._pos.tuple() for tree in trees],
+        dtype=np.int64,
+    ).reshape(len(trees), 2)
+    arrays["tree_energy"] = np.array([tree._energy for tree in trees], dtype=np.int64)
+    arrays["tree_fitness"] = np.array([tree._fitness for tree in trees], dtype=np.int64)
+    arrays["tree_nutrients"] = np.array([tree._nutrients for tree in trees], dtype=np.int64)
+    arrays["tree_age"] = np.array([tree._age for tree in trees], dtype=np.int64)
+    for field in _GENOME_FIELDS:
+        arrays[f"genome_{field}"] = (
+            np.concatenate([getattr(genome, field) for genome in genomes])
+            if genomes else getattr(TreeGenome([], [], [], [], []), field)
+        )
+
+    write_checkpoint(path, meta, arrays)
+
+
+def load_environment(
+    path: str,
+) -> Environment:
+    with CheckpointReader(path) as reader:
+        return _restore_environment(reader)
+
+
+def _restore_environment(
+    reader: CheckpointReader,
+) -> Environment:
+    meta = reader.meta
+
+    # Build the environment without running __init__, which would generate
+    # a new landscape and warm up a new set of particles. Parameters that
+    # differ from the class defaults are shadowed on the instance.
+    environment = Environment.__new__(Environment)
+    for name, value in meta["params"].items():
+        if getattr(Environment, name) != value:
+            setattr(environment, name, value)
+
+    environment._dims = Dims(environment.WIDTH, environment.HEIGHT)
+    environment._collision_mode = CollisionMode(meta["collision_mode"])
+    environment._num_ticks = meta["num_ticks"]
+    environment._mutation = MutationConfig(**meta["mutation"])
+
+    for name in _STREAMS:
+        stream = RandomStream()
+        stream.set_state({
+            **meta["streams"][name],
+            "buffer": reader.array(f"stream{name}_buffer"),
+        })
+        setattr(environment, name, stream)
+
+    environment._trees = []
+    environment._node_grid = NodeGrid()
+    environment.stats = TickStats()
+    environment.telemetry = None
+    environment._num_absorbed = 0
+
+    particles = ParticleStore(max(len(reader.array("particles_id")), ParticleStore.INITIAL_CAPACITY))
+    num_particles = len(reader.array("particles_id"))
+    for column in ParticleStore._COLUMNS:
+        getattr(particles, column)[:num_particles] = reader.array(f"particles{column}")
+    particles._size = num_particles
+    particles._next_id = meta["next_particle_id"]
+    environment._particles = particles
+
+    # Pending absorptions aren't stored. Leaving the scheduled grid version
+    # stale makes the first analytic tick reschedule every live particle.
+    environment._absorptions = AbsorptionQueue()
+    environment._scheduled_grid_version = -1
+
+    landscape = meta["landscape"]
+    environment._landscape = Landscape(
+        dims=environment._dims,
+        ground_baseline=landscape["ground_baseline"],
+        ground_freqs=landscape["ground_freqs"],
+        ground_amps=landscape["ground_amps"],
+        ground_disps=landscape["ground_disps"],
+    )
+
+    genome_fields = {field: reader.array(f"genome_{field}") for field in _GENOME_FIELDS}
+    num_nodes = reader.array("tree_num_nodes").tolist()
+    starts = np.concatenate([[0], np.cumsum(num_nodes)]).tolist()
+    roots = reader.array("tree_roots").tolist()
+    energies = reader.array("tree_energy").tolist()
+    fitnesses = reader.array("tree_fitness").tolist()
+    nutrients = reader.array("tree_nutrients").tolist()
+    ages = reader.array("tree_age").tolist()
+    for i, (x, y) in enumerate(roots):
+        genome = TreeGenome(**{
+            field: np.array(values[starts[i]:starts[i + 1]])
+            for field, values in genome_fields.items()
+        })
+        tree = Tree(Pos(x, y), genome, environment._tree_rng, environment._mutation)
+        tree._energy = energies[i]
+        tree._fitness = fitnesses[i]
+        tree._nutrients = nutrients[i]
+        tree._age = ages[i]
+        environment._trees.append(tree)
+        environment._index_tree(i)
+
+    return environment
@@ -23,21 +23,23 @@
 #############################################################################
 
 
-from enum import Enum
 import sys
 from typing import Optional
 
 import pygame
 
+from pytrees.picking import FramePicker
+from pytrees.render import (
+    draw_frame, draw_highlight, draw_stats, draw_tree, landscape_cache,
+    particle_sprite_cache,
+)
+from pytrees.state import PyTreesEvent
+from pytrees.transport import RenderFrame, RenderStatic
 from pytrees.utils import (
     Dims, Pos, PyTreeColor
 )
 
 
-class PyTreesEvent(Enum):
-    TOGGLE_TICK = "p"
-
-
 class PyTreesDisplay:
 
     def __init__(self) -> None:
@@ -69,11 +71,29 @@ class PyTreesDisplay:
         self.update()
 
         # Store misc state
-        self.clicked_tree: Optional[Tree] = None
+        # Key of the clicked tree, which stays valid across frames
+        self.clicked_tree: Optional[int] = None
+
+        # What is under the cursor, as (tree key, node row) in the last
+        # frame drawn, and the cursor's screen position while it is over
+        # the window
+        self.picker = FramePicker()
+        self.hovered: Optional[tuple[int, Optional[int]]] = None
+        self._hover_pos: Optional[Pos] = None
+
+        # Pre-rendered tree sprites as {tree key: (tree version, sprite)}.
+        # Tree keys are only unique per publisher, so the sprites are dropped
+        # whenever a new RenderStatic arrives.
+        self.tree_sprites: dict[int, tuple[int, pygame.Surface]] = {}
+        self._static: Optional[RenderStatic] = None
+
+        # Set when input changed what the window should show, so the next
+        # frame is drawn even if the simulation hasn't moved on
+        self.needs_redraw = True
 
     def process_events(
         self,
-        state: "PyTreesState",
+        frame: RenderFrame,
     ) -> set[PyTreesEvent]:
         returned_events: set[PyTreesEvent] = set()
 
@@ -82,62 +102,124 @@ class PyTreesDisplay:
             if event.type == pygame.QUIT:
                 pygame.quit()
                 sys.exit()
+            elif event.type == pygame.VIDEORESIZE:
+                # Cached surfaces were converted to the old window's format
+                landscape_cache.clear()
+                particle_sprite_cache.clear()
+                self.tree_sprites.clear()
+                self.needs_redraw = True
+            elif event.type == pygame.WINDOWEXPOSED:
+                self.needs_redraw = True
             elif event.type == pygame.MOUSEBUTTONDOWN:
                 self._mouse_buttons_pressed[0] = True
                 self._mouse_pos = self._mouse_pos_prev = Pos(*event.pos)
             elif event.type == pygame.MOUSEMOTION:
                 if self._mouse_buttons_pressed[0]:
                     self.offset = self._mouse_pos_prev - Pos(*event.pos) + self.offset
-                self._mouse_pos_prev = Pos(*event.pos)
+                    self.needs_redraw = True
+                self._mouse_pos_prev = self._hover_pos = Pos(*event.pos)
+                self._hover(frame)
+            elif event.type == pygame.WINDOWLEAVE:
+                self._hover_pos = None
+                self._hover(frame)
             elif event.type == pygame.MOUSEBUTTONUP:
                 self._mouse_buttons_pressed[0] = False
                 if self._mouse_pos == self._mouse_pos_prev:
                     self.mouse_click_screen = self._mouse_pos
                     self.mouse_click_world = self._mouse_pos + self.offset
-                    self._click(state)
+                    self._click(frame)
+                    self.needs_redraw = True
                 self._mouse_pos = self._mouse_pos_prev = Pos(*event.pos)
             elif event.type == pygame.KEYDOWN:
                 if event.key == pygame.K_d:
                     self.debug = not self.debug
+                    self.needs_redraw = True
                 elif event.key == pygame.K_p:
                     returned_events.add(PyTreesEvent.TOGGLE_TICK)
+                elif event.key == pygame.K_f:
+                    returned_events.add(PyTreesEvent.TOGGLE_PROFILE)
+                elif event.key == pygame.K_t:
+                    returned_events.add(PyTreesEvent.TOGGLE_FAST_FORWARD)
 
         return returned_events
 
+    def _pick(
+        self,
+        frame: RenderFrame,
+        pos: Pos,
+    ) -> Optional[tuple[int, Optional[int]]]:
+        # (tree key, node row) of what is drawn at a world position
+        self.picker.update(frame)
+        picked = self.picker.pick(pos)
+        if picked is None:
+            return None
+        return int(frame.trees[picked[0], RenderFrame.TREE_KEY]), picked[1]
+
     def _click(
         self,
-        state: "PyTreesState",
+        frame: RenderFrame,
     ) -> None:
         # Check if a tree has been clicked
-        for tree in state.environment._trees:
-            if tree.bounds.contains(self.mouse_click_world):
-                self.clicked_tree = tree
-                break
+        picked = self._pick(frame, self.mouse_click_world)
+        if picked is not None:
+            self.clicked_tree = picked[0]
+
+    def _hover(
+        self,
+        frame: RenderFrame,
+    ) -> None:
+        hovered = (
+            self._pick(frame, self._hover_pos + self.offset)
+            if self._hover_pos is not None else None
+        )
+        if hovered != self.hovered:
+            self.hovered = hovered
+            self.needs_redraw = True
 
     def draw(
         self,
-        state: "PyTreesState",
+        static: RenderStatic,
+        frame: RenderFrame,
     ) -> None:
-        # Draw the state
-        state.draw(self)
+        if static is not self._static:
+            self.tree_sprites.clear()
+            self._static = static
+
+        # Draw the frame, highlighting what is under the cursor in it. The
+        # highlight is brought up to date here, so it needs no extra redraw.
+        draw_frame(self, static, frame)
+        self._hover(frame)
+        self.needs_redraw = False
+        if self.hovered is not None:
+            index = frame.tree_index(self.hovered[0])
+            if index is not None:
+                draw_highlight(self, frame, index, self.hovered[1])
+        if self.debug:
+            draw_stats(self, frame)
 
         # Draw overlay information
-        if self.clicked_tree:
+        if self.clicked_tree is not None:
+            index = frame.tree_index(self.clicked_tree)
+            if index is None:
+                # The clicked tree no longer exists
+                self.clicked_tree = None
+                return
+
+            _, _, left, top, right, bottom, _, _, _ = frame.trees[index].tolist()
+            topleft = Pos(left, top)
             pygame.draw.rect(
                 surface=self.surface,
                 color=PyTreeColor.WHITE.value,
                 rect=pygame.Rect(
                     Pos(0, 0).tuple(),
-                    (
-                        self.clicked_tree.bounds.botright -
-                        self.clicked_tree.bounds.topleft +
-                        Dims(20, 20)
-                    ).tuple()
+                    (Pos(right, bottom) - topleft + Dims(20, 20)).tuple(),
                 ),
             )
-            self.clicked_tree.draw(
+            draw_tree(
                 display=self,
-                offset=self.clicked_tree.bounds.topleft - Pos(10, 10),
+                frame=frame,
+                index=index,
+                offset=topleft - Pos(10, 10),
             )
 
     @property
@@ -150,6 +232,3 @@ class PyTreesDisplay:
         self,
     ) -> None:
         pygame.display.flip()
-
-from pytrees.state import PyTreesState
-from pytrees.tree import Tree
@@ -24,27 +24,36 @@
 
 
 from enum import Enum
-import math
-import random
-from typing import Optional
+from typing import TYPE_CHECKING, Any, Optional
 
-import pygame
-from pytrees.display import PyTreesDisplay
+import numpy as np
 
-
-from pytrees.interfaces import Drawable
+from pytrees.genome import TreeGenome
+from pytrees.instrumentation import TickStats
+from pytrees.mutation import MutationConfig
+from pytrees.interfaces import Tickable
+from pytrees.particles import AbsorptionQueue, ParticleStore, ParticleType
+from pytrees.rng import RandomStream, Seed
+from pytrees.spatial import NodeGrid
 from pytrees.tree import Tree
 from pytrees.utils import (
-    Pos, Dims, PyTreeColor, draw_text,
+    Pos, Dims,
 )
 
+if TYPE_CHECKING:
+    from pytrees.telemetry import TelemetryWriter
+    from pytrees.warmup import WarmupCache
+
 
-class ParticleType(Enum):
-    SUN = 0
-    WATER = 1
+class CollisionMode(Enum):
+    # Move every particle one pixel per tick and test it for collisions
+    STEPPED = "stepped"
+    # Work out where each particle will be absorbed when it spawns, and only
+    # touch it again on that tick
+    ANALYTIC = "analytic"
 
 
-class Environment(Drawable):
+class Environment(Tickable):
 
     WIDTH = 3000
     HEIGHT = 1200
@@ -52,32 +61,55 @@ class Environment(Drawable):
     NUM_TREES_STARTING = 200
     NUM_WARMUP_TICKS = 1000
 
-    def __init__(self) -> None:
+    NUM_PARTICLES_PER_TICK = 2
+
+    # Optional cache of warmed-up particle fields, used by every seeded
+    # environment built while it is set
+    warmup_cache: Optional["WarmupCache"] = None
+
+    def __init__(
+        self,
+        collision_mode: CollisionMode = CollisionMode.STEPPED,
+        genomes: Optional[list[TreeGenome]] = None,
+        seed: Seed = None,
+        mutation: Optional[MutationConfig] = None,
+    ) -> None:
         self._dims = Dims(self.WIDTH, self.HEIGHT)
+        self._collision_mode = collision_mode
+        self._mutation = mutation if mutation is not None else MutationConfig()
+        self._num_ticks = 0
+
+        # Independent random streams, so that e.g. a change in how many
+        # numbers tree growth draws doesn't shift where particles spawn
+        self._rng = RandomStream(seed)
+        self._landscape_rng, self._particle_rng, self._tree_rng = self._rng.spawn(3)
 
         self._trees: list[Tree] = []
+        self._node_grid = NodeGrid()
 
-        self._particles_sun: set[Particle] = set()
-        self._particles_water: set[Particle] = set()
+        self._particles = ParticleStore()
+
+        # Per-phase timings and counters, filled in on every tick
+        self.stats = TickStats()
+
+        # Optional time series output, and particles absorbed this tick
+        self.telemetry: Optional["TelemetryWriter"] = None
+        self._num_absorbed = 0
+
+        # Pending absorptions, used by CollisionMode.ANALYTIC
+        self._absorptions = AbsorptionQueue()
+        self._scheduled_grid_version = self._node_grid.version
 
         # Create landscape
         gFreq = [
             0.002, 0.01, 0.04, 0.2, 0.5
         ]
-        gAmp = [
-            random.random()*500,
-            random.random()*200,
-            random.random()*80,
-            random.random()*5,
-            random.random()*5
-        ]
-        gDisp = [
-            random.random()*500,
-            random.random()*500,
-            random.random()*500,
-            random.random()*500,
-            random.random()*500
-        ]
+        gAmp = (
+            self._landscape_rng.uniform(5) * [500, 200, 80, 5, 5]
+        ).tolist()
+        gDisp = (
+            self._landscape_rng.uniform(5) * 500
+        ).tolist()
         self._landscape = Landscape(
             dims=self._dims,
             ground_baseline=100,
@@ -87,124 +119,282 @@ class Environment(Drawable):
         )
 
         # Create initial particles
-        self._warmup(self.NUM_WARMUP_TICKS)
+        self._warmup(self.NUM_WARMUP_TICKS, cacheable=seed is not None)
 
-        # Create trees
-        for _ in range(self.NUM_TREES_STARTING):
-            x_pos = random.randint(0, self.WIDTH)
+        # Create trees, either at random or grown from the given genomes
+        tree_genomes: list[Optional[TreeGenome]] = (
+            [None] * self.NUM_TREES_STARTING if genomes is None else list(genomes)
+        )
+        tree_xs = self._tree_rng.integers(0, self.WIDTH, len(tree_genomes))
+        for genome, x_pos in zip(tree_genomes, tree_xs.tolist()):
             self._trees.append(Tree(
                 Pos(
                     x_pos,
-                    self._landscape._ground_levels[x_pos],
-                )
+                    int(self._landscape._ground_levels[x_pos]),
+                ),
+                genome,
+                self._tree_rng,
+                self._mutation,
             ))
+            self._index_tree(len(self._trees) - 1)
+
+    @classmethod
+    def with_params(
+        cls,
+        params: dict[str, Any],
+        **kwargs: Any,
+    ) -> "Environment":
+        # Build an environment with some of its class attribute parameters
+        # (WIDTH, NUM_TREES_STARTING, ...) overridden for this instance only.
+        # The result still pickles as a plain Environment.
+        cls.check_params(params)
+        environment = cls.__new__(cls)
+        for name, value in params.items():
+            setattr(environment, name, value)
+        environment.__init__(**kwargs)
+        return environment
+
+    @classmethod
+    def check_params(
+        cls,
+        params: dict[str, Any],
+    ) -> None:
+        # Raise on any name with_params would not accept
+        for name in params:
+            if not name.isupper() or not hasattr(cls, name):
+                raise ValueError(f"unknown environment parameter: {name}")
+
+    def _index_tree(
+        self,
+        index: int,
+    ) -> None:
+        # (Re-)enter a tree's nodes into the collision grid. Must be called
+        # whenever the tree at this index is added, replaced or mutated.
+        nodes = self._trees[index]._nodes
+        self._node_grid.insert(
+            index,
+            np.fromiter((node._pos.x for node in nodes), np.int64, len(nodes)),
+            np.fromiter((node._pos.y for node in nodes), np.int64, len(nodes)),
+            np.fromiter((node._size for node in nodes), np.int64, len(nodes)),
+        )
+
+    @property
+    def particles(self) -> ParticleStore:
+        # Analytic collisions don't move particles every tick, so bring their
+        # positions up to date before handing them out
+        if self._collision_mode is CollisionMode.ANALYTIC:
+            self._particles.sync(self._num_ticks)
+        return self._particles
+
+    def _solve_dirty_trees(self) -> None:
+        # Only trees that were mutated since the last tick need their
+        # geometry re-solved and re-indexed
+        for index, tree in enumerate(self._trees):
+            if tree._dirty:
+                tree.solve()
+                self._index_tree(index)
 
     def _warmup(
         self,
         num_ticks: int,
+        cacheable: bool = False,
     ) -> None:
-        for _ in range(num_ticks):
-            self.tick()
+        # Fill the sky with particles before any trees exist. Unseeded
+        # environments never build the same field twice, so aren't cached.
+        cache = self.warmup_cache if cacheable else None
+        if cache is None or not cache.load(self, num_ticks):
+            self._spawn_warmup_particles(num_ticks)
+            if cache is not None:
+                cache.save(self, num_ticks)
+
+        if self._collision_mode is CollisionMode.ANALYTIC:
+            self._schedule_absorptions(np.arange(len(self._particles)))
+
+    def _spawn_warmup_particles(
+        self,
+        num_ticks: int,
+    ) -> None:
+        # Without trees, a particle just falls until it reaches the landscape
+        # or the bottom of the world. So instead of ticking, draw the spawn
+        # positions in the same order tick() would and keep the particles
+        # that are still falling at the end. The result is identical to
+        # ticking num_ticks times, in either collision mode.
+        num_per_tick = self.NUM_PARTICLES_PER_TICK
+        xs = np.empty((num_ticks, 2, num_per_tick), dtype=np.int64)
+        for tick in range(num_ticks):
+            xs[tick, 0] = self._particle_rng.integers(0, self.WIDTH, num_per_tick)
+            xs[tick, 1] = self._particle_rng.integers(0, self.WIDTH, num_per_tick)
+        births = np.broadcast_to(
+            self._num_ticks + np.arange(num_ticks).reshape(num_ticks, 1, 1),
+            xs.shape,
+        ).ravel()
+        types = np.broadcast_to(
+            np.array([ParticleType.SUN.value, ParticleType.WATER.value], dtype=np.int8)
+            .reshape(1, 2, 1),
+            xs.shape,
+        ).ravel()
+        xs = xs.ravel()
+        ids = self._particles.allocate_ids(len(xs))
+        self._num_ticks += num_ticks
+
+        ys = self._num_ticks - births
+        falling = ys < self._first_ground_ys(xs, np.ones(len(xs), dtype=np.int64))
+        self._particles.append(
+            ids[falling],
+            births[falling],
+            xs[falling],
+            types[falling],
+            self._num_ticks,
+        )
 
     def _add_new_particles(
         self,
         num_particles: int,
         type: ParticleType,
-    ) -> None:
-        for _ in range(num_particles):
-            if type is ParticleType.SUN:
-                self._particles_sun.add(ParticleSun(
-                    random.randint(0, self.WIDTH),
-                    0,
-                ))
-            elif type is ParticleType.WATER:
-                self._particles_water.add(ParticleRain(
-                    random.randint(0, self.WIDTH),
-                    0,
-                ))
-
-    def draw(
+    ) -> np.ndarray:
+        return self._particles.spawn(
+            self._particle_rng.integers(0, self.WIDTH, num_particles),
+            type,
+            self._num_ticks,
+        )
+
+    def tick(self) -> None:
+        stats = self.stats
+        num_tests = self._node_grid.num_tests
+        stats.begin()
+        self._num_absorbed = 0
+        self._solve_dirty_trees()
+        stats.lap("solve")
+        if self._collision_mode is CollisionMode.ANALYTIC:
+            self._tick_analytic()
+        else:
+            self._tick_stepped()
+        if self.telemetry is not None:
+            self.telemetry.record_tick(self, self._num_absorbed)
+        self._num_ticks += 1
+
+        stats.count("live_particles", len(self._particles))
+        stats.count("collision_tests", self._node_grid.num_tests - num_tests)
+        stats.end_tick()
+
+    def _tick_stepped(self) -> None:
+        stats = self.stats
+        self._add_new_particles(self.NUM_PARTICLES_PER_TICK, ParticleType.SUN)
+        self._add_new_particles(self.NUM_PARTICLES_PER_TICK, ParticleType.WATER)
+        stats.lap("spawn")
+        self._particles.advance()
+        stats.lap("step")
+        self._collide_particles_with_landscape()
+        stats.lap("landscape")
+        self._collide_particles_with_trees()
+        stats.lap("trees")
+        self._particles.cull()
+        stats.lap("cull")
+
+    def _tick_analytic(self) -> None:
+        stats = self.stats
+
+        # Any change to the trees invalidates every pending absorption
+        if self._scheduled_grid_version != self._node_grid.version:
+            self._absorptions.clear()
+            self._schedule_absorptions(np.flatnonzero(self._particles.alive))
+            self._scheduled_grid_version = self._node_grid.version
+        stats.lap("reschedule")
+
+        new_particles = np.concatenate([
+            self._add_new_particles(self.NUM_PARTICLES_PER_TICK, ParticleType.SUN),
+            self._add_new_particles(self.NUM_PARTICLES_PER_TICK, ParticleType.WATER),
+        ])
+        stats.lap("spawn")
+        self._schedule_absorptions(new_particles)
+        stats.lap("trees")
+
+        ids, hit_trees, powers = self._absorptions.pop_due(self._num_ticks)
+        self._particles.alive[self._particles.index_of(ids)] = False
+        self._absorb(hit_trees, powers)
+        stats.lap("absorb")
+        self._particles.cull()
+        stats.lap("cull")
+
+    def _schedule_absorptions(
         self,
-        display: PyTreesDisplay,
-        offset: Optional[Pos] = None,
+        indices: np.ndarray,
     ) -> None:
-        if offset is None:
-            offset = display.offset
-
-        # Draw background
-        display.surface.fill(color=PyTreeColor.SKY_BLUE.value)
-
-        # Draw bounding box
-        pygame.draw.rect(
-            surface=display.surface,
-            color=PyTreeColor.BLACK.value,
-            rect=pygame.Rect(
-                (-offset).tuple(),
-                self._dims.tuple(),
-            ),
-            width=1,
+        # Cast each particle's path from the height it reaches this tick
+        # down to the landscape or the bottom of the world, and queue the
+        # tick on which it will be absorbed
+        births = self._particles.births[indices]
+        xs = self._particles.xs[indices]
+        ys_from = self._num_ticks - births + 1
+
+        end_ys = self._first_ground_ys(xs, ys_from)
+        hit_ys, hit_trees = self._node_grid.cast(xs, ys_from)
+        hits = (hit_ys >= 0) & (hit_ys < end_ys)
+        stop_ys = np.where(hits, hit_ys, end_ys)
+
+        self._absorptions.schedule(
+            ticks=births + stop_ys - 1,
+            ids=self._particles.ids[indices],
+            trees=np.where(hits, hit_trees, -1),
+            powers=ParticleStore.power_at(self._particles.types[indices], stop_ys),
         )
 
-        # Draw landscape
-        self._landscape.draw(display)
-
-        # Draw trees
-        for tree in self._trees:
-            tree.draw(display)
-
-        # Draw sun particles
-        for particle_sun in self._particles_sun:
-            particle_sun.draw(display)
-
-        # Draw water particles
-        for particle_water in self._particles_water:
-            particle_water.draw(display)
-
-    def tick(self) -> None:
-        self._add_new_particles(2, ParticleType.SUN)
-        self._add_new_particles(2, ParticleType.WATER)
-        for p in self._particles_sun:
-            p.tick()
-        for p in self._particles_water:
-            p.tick()
-        self._particles_sun = self._collide_particles_with_landscape(self._particles_sun)
-        self._particles_water = self._collide_particles_with_landscape(self._particles_water)
-        self._particles_sun = self._collide_particles_with_trees(self._particles_sun)
-        self._particles_water = self._collide_particles_with_trees(self._particles_water)
-
-    def _collide_particles_with_landscape(
+    def _first_ground_ys(
         self,
-        particles: set["Particle"],
-    ) -> set["Particle"]:
-        ret: set[Particle] = set()
-        for particle in particles:
-            if not self._landscape.is_pos_ground(particle):
-                ret.add(particle)
-        return ret
+        xs: np.ndarray,
+        ys_from: np.ndarray,
+    ) -> np.ndarray:
+        # First y at or after ys_from at which a particle falling at each x
+        # is removed by the landscape or by leaving the world
+        on_land = (xs >= 0) & (xs < self.WIDTH)
+        ground_ys = np.full(len(xs), self.HEIGHT, dtype=np.int64)
+        ground_ys[on_land] = self._landscape._ground_levels[xs[on_land]]
+        return np.minimum(np.maximum(ground_ys, ys_from), self.HEIGHT)
+
+    def _collide_particles_with_landscape(self) -> None:
+        # Particles that have fallen out of the bottom of the world can never
+        # hit anything again
+        self._particles.kill(self._particles.ys >= self.HEIGHT)
+
+        self._particles.kill(self._landscape.is_pos_ground_many(
+            self._particles.xs,
+            self._particles.ys,
+        ))
+
+    def _collide_particles_with_trees(self) -> None:
+        # Each particle is absorbed by the first tree (in list order) with a
+        # node containing it
+        candidates = np.flatnonzero(self._particles.alive)
+        hit_trees = self._node_grid.query(
+            self._particles.xs[candidates],
+            self._particles.ys[candidates],
+        )
+        hits = hit_trees >= 0
+        absorbed = candidates[hits]
+        self._particles.alive[absorbed] = False
+        self._absorb(hit_trees[hits], self._particles.powers[absorbed])
 
-    def _collide_particles_with_trees(
+    def _absorb(
         self,
-        particles: set["Particle"],
-    ) -> set["Particle"]:
-        for particle in particles:
-            for tree in self._trees:
-                if tree.bounds.contains(particle):
-                    for node in tree._nodes:
-                        if node.contains(particle):
-                            particle.spent = True
-                            tree._energy += particle.power
-                            break
-                    if particle.spent:
-                        break
-
-        return {
-            particle
-            for particle in particles
-            if not particle.spent
-        }
-
-
-class Landscape(Drawable):
+        hit_trees: np.ndarray,
+        powers: np.ndarray,
+    ) -> None:
+        # Give each tree the power of every particle it absorbed. A tree index
+        # of -1 means the particle hit no tree.
+        hits = hit_trees >= 0
+        energy_gains = np.zeros(len(self._trees), dtype=np.int64)
+        np.add.at(energy_gains, hit_trees[hits], powers[hits])
+        num_hits = int(np.count_nonzero(hits))
+        self._num_absorbed += num_hits
+        self.stats.count("hits", num_hits)
+        self.stats.count_tree_hits(hit_trees[hits], len(self._trees))
+        if self.telemetry is not None:
+            self.telemetry.record_absorptions(self._num_ticks, hit_trees[hits], powers[hits])
+        for index in np.flatnonzero(energy_gains).tolist():
+            self._trees[index]._energy += int(energy_gains[index])
+
+
+class Landscape:
 
     def __init__(
         self,
@@ -225,31 +415,20 @@ class Landscape(Drawable):
             len(self._ground_amps),
         )
 
-        self._ground_levels: list[int] = []
+        self._ground_levels = np.zeros(self._dims.x, dtype=np.int64)
         self._populate_ground_levels()
 
-    def draw(
-        self,
-        display: PyTreesDisplay,
-        offset: Optional[Pos] = None,
-    ) -> None:
-        for i, level in enumerate(self._ground_levels):
-            pygame.draw.line(
-                surface=display.surface,
-                color=PyTreeColor.BROWN.value,
-                start_pos=(Pos(i, level) - display.offset).tuple(),
-                end_pos=(Pos(i, self._dims.y) - display.offset).tuple(),
-            )
-
     def _populate_ground_levels(self) -> None:
-        for x in range(self._dims.x):
-            sum: float = 0
-            for d in range(self._ground_degree):
-                sum += int(math.cos(
-                    self._ground_freqs[d]*x + self._ground_disps[d]
-                )*self._ground_amps[d])
-                sum += self._ground_baseline
-            self._ground_levels.append(sum)
+        # Each degree adds a truncated cosine wave plus the baseline
+        xs = np.arange(self._dims.x)
+        degrees = slice(0, self._ground_degree)
+        freqs = np.array(self._ground_freqs[degrees])[:, np.newaxis]
+        amps = np.array(self._ground_amps[degrees])[:, np.newaxis]
+        disps = np.array(self._ground_disps[degrees])[:, np.newaxis]
+        waves = np.trunc(np.cos(freqs*xs + disps)*amps).astype(np.int64)
+        self._ground_levels = (
+            waves.sum(axis=0) + self._ground_baseline*self._ground_degree
+        )
 
     def is_pos_ground(self, pos: Pos) -> bool:
         if (
@@ -262,75 +441,16 @@ class Landscape(Drawable):
         else:
             return False
 
-
-class Particle(Pos, Drawable):
-
-    def __init__(
-        self,
-        x: int, y: int,
-        color: str,
-        power: int,
-    ) -> None:
-        super().__init__(x, y)
-        self._color = color
-        self.spent = False
-        self.power = power
-        self.diameter = 5
-
-    def draw(
+    def is_pos_ground_many(
         self,
-        display: PyTreesDisplay,
-        offset: Optional[Pos] = None,
-    ) -> None:
-        pygame.draw.rect(
-            surface=display.surface,
-            color=self._color,
-            rect=pygame.Rect(
-                (self - display.offset - Pos(2, 2)).tuple(),
-                (self.diameter, self.diameter),
-            ),
+        xs: np.ndarray,
+        ys: np.ndarray,
+    ) -> np.ndarray:
+        # Vectorized is_pos_ground over a batch of positions
+        in_bounds = (
+            (xs >= 0) & (xs < self._dims.x) &
+            (ys >= 0) & (ys < self._dims.y)
         )
-        if display.debug:
-            draw_text(
-                surface=display.surface,
-                left_top=(self - display.offset),
-                text=str(self.power),
-                fontsize=10,
-            )
-        # if DEBUG:
-        #     display.surface.create_text(
-        #         self.tuple(),
-        #         fill=PyTreeColor.BLACK.value,
-        #         text=str(self.power),
-        #     )
-
-    def tick(
-        self,
-    ) -> None:
-        self.y += 1
-
-
-class ParticleSun(Particle):
-
-    POWER_BASE = 70000
-    POWER_INC_PER_TICK = -45
-
-    def __init__(self, x: int, y: int) -> None:
-        super().__init__(x, y, PyTreeColor.YELLOW.value, self.POWER_BASE)
-
-    def tick(self) -> None:
-        self.power += self.POWER_INC_PER_TICK
-        return super().tick()
-
-
-class ParticleRain(Particle):
-
-    POWER_BASE = -50000
-    POWER_INC_PER_TICK = 55
-
-    def __init__(self, x: int, y: int) -> None:
-        super().__init__(x, y, PyTreeColor.BLUE.value, self.POWER_BASE)
-
-    def tick(self) -> None:
-        self.power += self.POWER_INC_PER_TICK
-        return super().tick()
+        ret = np.zeros(len(xs), dtype=np.bool_)
+        ret[in_bounds] = self._ground_levels[xs[in_bounds]] <= ys[in_bounds]
+        return ret
@@ -0,0 +1,282 @@
+#############################################################################
+# MIT License
+
+# Copyright (c) 2023-2024 Chris Urffer
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#############################################################################
+
+
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import os
+import time
+from typing import Optional
+
+import numpy as np
+
+from pytrees.environment import CollisionMode, Environment
+from pytrees.genome import TreeGenome
+from pytrees.mutation import MutationConfig
+from pytrees.rng import RandomStream
+from pytrees.telemetry import TelemetryWriter
+from pytrees.tree import Tree
+from pytrees.utils import Pos
+
+
+class GenerationResult:
+
+    def __init__(
+        self,
+        generation: int,
+        energies: list[int],
+        node_counts: list[int],
+        ages: list[int],
+        duration: float,
+    ) -> None:
+        self.generation = generation
+        self.energies = energies
+        self.node_counts = node_counts
+        # Generations each genome has survived unchanged
+        self.ages = ages
+        self.duration = duration
+
+    @property
+    def best_energy(self) -> int:
+        return max(self.energies)
+
+    @property
+    def mean_energy(self) -> float:
+        return sum(self.energies) / len(self.energies)
+
+    @property
+    def mean_age(self) -> float:
+        return sum(self.ages) / len(self.ages)
+
+    def __repr__(self) -> str:
+        return (
+            f"generation {self.generation}: "
+            f"best {self.best_energy}, mean {self.mean_energy:.0f}, "
+            f"mean nodes {sum(self.node_counts) / len(self.node_counts):.1f}, "
+            f"oldest {max(self.ages)}, "
+            f"{self.duration:.2f} sec"
+        )
+
+
+def _evaluate_shard(
+    genomes: list[TreeGenome],
+    seed: np.random.SeedSequence,
+    num_ticks: int,
+    collision_mode: CollisionMode,
+    mutation: MutationConfig,
+) -> list[int]:
+    # Grow the genomes in a fresh environment and return each tree's energy
+    # after num_ticks. Runs in a worker process.
+    environment = Environment(
+        collision_mode=collision_mode,
+        genomes=genomes,
+        seed=seed,
+        mutation=mutation,
+    )
+    for _ in range(num_ticks):
+        environment.tick()
+    return [tree._energy for tree in environment._trees]
+
+
+class Evolution:
+
+    # Runs the genetic algorithm: each generation, the population is split
+    # into shards, each shard is grown in its own environment for a fixed
+    # number of ticks, and the next population is bred from the trees that
+    # gathered the most energy.
+
+    NUM_TICKS_PER_GENERATION = 2000
+    SURVIVAL_RATE = 0.5
+
+    def __init__(
+        self,
+        population_size: int = Environment.NUM_TREES_STARTING,
+        num_shards: Optional[int] = None,
+        num_ticks_per_generation: int = NUM_TICKS_PER_GENERATION,
+        collision_mode: CollisionMode = CollisionMode.ANALYTIC,
+        seed: int = 0,
+        mutation: Optional[MutationConfig] = None,
+    ) -> None:
+        self._num_shards = num_shards or os.cpu_count() or 1
+        self._num_ticks_per_generation = num_ticks_per_generation
+        self._collision_mode = collision_mode
+        self._mutation = mutation if mutation is not None else MutationConfig()
+        self._generation = 0
+
+        # Shard seeds are spawned from the run's seed sequence, so every
+        # shard of every generation gets its own non-overlapping stream.
+        # Breeding happens in this process, from a stream of its own.
+        self._seed_sequence = np.random.SeedSequence(seed)
+        self._rng = RandomStream(self._seed_sequence.spawn(1)[0])
+
+        self._population: list[TreeGenome] = [
+            Tree(Pos(0, 0), rng=self._rng, mutation=self._mutation).genome()
+            for _ in range(population_size)
+        ]
+        self._ages = [0] * population_size
+
+    @property
+    def population(self) -> list[TreeGenome]:
+        return self._population
+
+    def run(
+        self,
+        num_generations: int,
+        executor: Optional[ProcessPoolExecutor] = None,
+    ) -> list[GenerationResult]:
+        if executor is None and self._num_shards > 1:
+            with ProcessPoolExecutor(max_workers=self._num_shards) as executor:
+                return self.run(num_generations, executor)
+        return [self.step(executor) for _ in range(num_generations)]
+
+    def step(
+        self,
+        executor: Optional[ProcessPoolExecutor] = None,
+    ) -> GenerationResult:
+        time_start = time.time()
+        energies = self._evaluate(executor)
+        result = GenerationResult(
+            generation=self._generation,
+            energies=energies,
+            node_counts=[len(genome) for genome in self._population],
+            ages=list(self._ages),
+            duration=time.time() - time_start,
+        )
+        self._breed(energies)
+        self._generation += 1
+        return result
+
+    def _evaluate(
+        self,
+        executor: Optional[ProcessPoolExecutor],
+    ) -> list[int]:
+        # Deal the population out to shards at random, so a tree's neighbours
+        # change from one generation to the next
+        order = self._rng.permutation(len(self._population))
+        shards = [
+            shard.tolist()
+            for shard in np.array_split(order, self._num_shards)
+            if len(shard)
+        ]
+        args = [
+            (
+                [self._population[i] for i in shard],
+                shard_seed,
+                self._num_ticks_per_generation,
+                self._collision_mode,
+                self._mutation,
+            )
+            for shard, shard_seed in zip(
+                shards,
+                self._seed_sequence.spawn(len(shards)),
+            )
+        ]
+
+        if executor is None:
+            shard_energies = [_evaluate_shard(*arg) for arg in args]
+        else:
+            shard_energies = list(executor.map(_evaluate_shard, *zip(*args)))
+
+        energies = [0] * len(self._population)
+        for shard, energy in zip(shards, shard_energies):
+            for i, e in zip(shard, energy):
+                energies[i] = e
+        return energies
+
+    def _breed(
+        self,
+        energies: list[int],
+    ) -> None:
+        # The fittest trees survive unchanged; the rest of the population is
+        # refilled with mutated clones of the survivors
+        ranked = sorted(
+            range(len(self._population)),
+            key=lambda i: energies[i],
+            reverse=True,
+        )
+        num_survivors = max(1, int(len(ranked) * self.SURVIVAL_RATE))
+        survivors = ranked[:num_survivors]
+
+        population = [self._population[i] for i in survivors]
+        ages = [self._ages[i] + 1 for i in survivors]
+
+        while len(population) < len(self._population):
+            parent = self._population[self._rng.choice(survivors)]
+            child = Tree(Pos(0, 0), parent.copy(), self._rng, self._mutation)
+            child._root_node.mutate()
+            child.solve()
+            population.append(child.genome())
+            ages.append(0)
+
+        self._population = population
+        self._ages = ages
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Evolve PyTrees without a display")
+    parser.add_argument("--generations", type=int, default=10)
+    parser.add_argument(
+        "--ticks",
+        type=int,
+        default=Evolution.NUM_TICKS_PER_GENERATION,
+        help="ticks per generation",
+    )
+    parser.add_argument(
+        "--population",
+        type=int,
+        default=Environment.NUM_TREES_STARTING,
+    )
+    parser.add_argument(
+        "--shards",
+        type=int,
+        default=None,
+        help="environment shards per generation (default: one per core)",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--telemetry",
+        default=None,
+        help="directory to stream per-generation telemetry to",
+    )
+    args = parser.parse_args()
+
+    evolution = Evolution(
+        population_size=args.population,
+        num_shards=args.shards,
+        num_ticks_per_generation=args.ticks,
+        seed=args.seed,
+    )
+    telemetry = TelemetryWriter(args.telemetry) if args.telemetry is not None else None
+    with ProcessPoolExecutor(max_workers=evolution._num_shards) as executor:
+        for _ in range(args.generations):
+            result = evolution.step(executor)
+            print(result)
+            if telemetry is not None:
+                telemetry.record_generation(result)
+    if telemetry is not None:
+        telemetry.close()
+
+
+if __name__ == '__main__':
+    main()
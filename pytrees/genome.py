@@ -0,0 +1,109 @@
+#############################################################################
+# MIT License
+
+# Copyright (c) 2023-2024 Chris Urffer
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#############################################################################
+
+
+import numpy as np
+
+from pytrees.utils import Pos
+
+
+class TreeGenome:
+
+    # Flat representation of a tree's nodes as parallel arrays, one entry
+    # per node in pre-order, so every parent comes before its children. The
+    # root is entry 0 and has a parent of -1. Absolute positions are not
+    # stored; they follow from the root position, angles and distances.
+
+    def __init__(
+        self,
+        parents: np.ndarray,
+        types: np.ndarray,
+        angles: np.ndarray,
+        dists: np.ndarray,
+        sizes: np.ndarray,
+    ) -> None:
+        self.parents = np.asarray(parents, dtype=np.int32)
+        self.types = np.asarray(types, dtype=np.int8)
+        self.angles = np.asarray(angles, dtype=np.float64)
+        self.dists = np.asarray(dists, dtype=np.float64)
+        self.sizes = np.asarray(sizes, dtype=np.int32)
+
+    def __len__(self) -> int:
+        return len(self.parents)
+
+    def __eq__(self, __value: object) -> bool:
+        if type(__value) is not TreeGenome:
+            return False
+        return (
+            np.array_equal(self.parents, __value.parents) and
+            np.array_equal(self.types, __value.types) and
+            np.array_equal(self.angles, __value.angles) and
+            np.array_equal(self.dists, __value.dists) and
+            np.array_equal(self.sizes, __value.sizes)
+        )
+
+    @property
+    def nbytes(self) -> int:
+        return (
+            self.parents.nbytes + self.types.nbytes + self.angles.nbytes +
+            self.dists.nbytes + self.sizes.nbytes
+        )
+
+    def copy(self) -> "TreeGenome":
+        return TreeGenome(
+            parents=self.parents.copy(),
+            types=self.types.copy(),
+            angles=self.angles.copy(),
+            dists=self.dists.copy(),
+            sizes=self.sizes.copy(),
+        )
+
+    def offsets(self) -> tuple[np.ndarray, np.ndarray]:
+        # Integer offset of each node from its parent, truncated the same way
+        # as TreeNode.update_pos_absolute. The root has no offset.
+        dxs = np.trunc(np.sin(self.angles) * self.dists).astype(np.int64)
+        dys = np.trunc(np.cos(self.angles) * self.dists).astype(np.int64)
+        is_root = self.parents < 0
+        dxs[is_root] = 0
+        dys[is_root] = 0
+        return dxs, dys
+
+    def positions(
+        self,
+        root: Pos,
+    ) -> tuple[np.ndarray, np.ndarray]:
+        # Absolute position of every node. Offsets are summed up each node's
+        # ancestry by pointer jumping, which takes log(depth) vectorized
+        # steps rather than one step per node.
+        xs, ys = self.offsets()
+        ancestors = self.parents.astype(np.int64)
+        while True:
+            jumping = np.flatnonzero(ancestors >= 0)
+            if len(jumping) == 0:
+                break
+            targets = ancestors[jumping]
+            xs[jumping] += xs[targets]
+            ys[jumping] += ys[targets]
+            ancestors[jumping] = ancestors[targets]
+        return xs + root.x, ys + root.y
@@ -0,0 +1,212 @@
+#############################################################################
+# MIT License
+
+# Copyright (c) 2023-2024 Chris Urffer
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#############################################################################
+
+
+import argparse
+import signal
+import threading
+import time
+from typing import Any, Optional
+
+from pytrees.checkpoint import load_environment, save_environment
+from pytrees.environment import CollisionMode
+from pytrees.instrumentation import StatsDumper
+from pytrees.state import PyTreesState
+from pytrees.telemetry import TelemetryWriter
+
+
+# Entry point for running the simulation without a renderer. Nothing reachable
+# from this module imports pygame, so it can be used on hosts with no display.
+def run_headless(
+    num_ticks: Optional[int] = None,
+    report_interval: float = 1.0,
+    collision_mode: CollisionMode = CollisionMode.STEPPED,
+    seed: Optional[int] = None,
+    stats_path: Optional[str] = None,
+    stats_interval: float = 10.0,
+    profile_path: Optional[str] = None,
+    checkpoint_path: Optional[str] = None,
+    checkpoint_interval: int = 0,
+    restore_path: Optional[str] = None,
+    telemetry_path: Optional[str] = None,
+    telemetry_interval: int = 1,
+) -> PyTreesState:
+    state = PyTreesState(
+        collision_mode,
+        seed,
+        environment=load_environment(restore_path) if restore_path is not None else None,
+    )
+    stats = state.environment.stats
+    dumper = None
+    if stats_path is not None:
+        dumper = StatsDumper(stats, stats_path, stats_interval)
+    if profile_path is not None:
+        stats.start_profiling()
+    if telemetry_path is not None:
+        state.environment.telemetry = TelemetryWriter(telemetry_path, telemetry_interval)
+
+    # Ctrl-C ends the run once the current tick is done, so the end-of-run
+    # output is written from a consistent state. A second Ctrl-C interrupts
+    # straight away.
+    interrupted = False
+    previous_handler: Any = None
+
+    def interrupt(signum: int, frame: Any) -> None:
+        nonlocal interrupted
+        interrupted = True
+        signal.signal(signal.SIGINT, previous_handler)
+
+    if threading.current_thread() is threading.main_thread():
+        previous_handler = signal.signal(signal.SIGINT, interrupt)
+
+    time_curr = time.time()
+    num_ticks_total = 0
+    num_ticks_this_interval = 0
+    # Whether the environment is part way through a tick
+    ticking = False
+    try:
+        while (num_ticks is None or num_ticks_total < num_ticks) and not interrupted:
+            ticking = True
+            state.tick()
+            ticking = False
+            num_ticks_total += 1
+            num_ticks_this_interval += 1
+
+            tick_end = time.time()
+            if report_interval > 0 and tick_end - time_curr >= report_interval:
+                print(f"{num_ticks_this_interval} ticks in {tick_end - time_curr} sec")
+                num_ticks_this_interval = 0
+                time_curr = tick_end
+            if dumper is not None:
+                dumper.maybe_dump()
+            if (
+                checkpoint_path is not None and checkpoint_interval > 0 and
+                num_ticks_total % checkpoint_interval == 0
+            ):
+                save_environment(state.environment, checkpoint_path)
+    finally:
+        if previous_handler is not None and not interrupted:
+            signal.signal(signal.SIGINT, previous_handler)
+        if checkpoint_path is not None and not ticking:
+            save_environment(state.environment, checkpoint_path)
+        if dumper is not None:
+            dumper.dump()
+        if profile_path is not None:
+            stats.stop_profiling(profile_path)
+        if state.environment.telemetry is not None:
+            state.environment.telemetry.close()
+            state.environment.telemetry = None
+
+    return state
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Run PyTrees without a display")
+    parser.add_argument(
+        "--ticks",
+        type=int,
+        default=None,
+        help="number of ticks to run (default: run forever)",
+    )
+    parser.add_argument(
+        "--report-interval",
+        type=float,
+        default=1.0,
+        help="seconds between tick rate reports, 0 to disable",
+    )
+    parser.add_argument(
+        "--collision-mode",
+        choices=[mode.value for mode in CollisionMode],
+        default=CollisionMode.STEPPED.value,
+        help="how particle collisions are resolved",
+    )
+    parser.add_argument(
+        "--seed",
+        type=int,
+        default=None,
+        help="seed for a reproducible run (default: seeded from the OS)",
+    )
+    parser.add_argument(
+        "--stats-file",
+        default=None,
+        help="append tick stats to this file, as CSV if it ends in .csv and JSON lines otherwise",
+    )
+    parser.add_argument(
+        "--stats-interval",
+        type=float,
+        default=10.0,
+        help="seconds between tick stats dumps",
+    )
+    parser.add_argument(
+        "--profile",
+        default=None,
+        help="profile the run with cProfile and write the result to this file",
+    )
+    parser.add_argument(
+        "--checkpoint",
+        default=None,
+        help="write a checkpoint of the simulation to this file when the run ends",
+    )
+    parser.add_argument(
+        "--checkpoint-every",
+        type=int,
+        default=0,
+        help="also write the checkpoint every this many ticks",
+    )
+    parser.add_argument(
+        "--restore",
+        default=None,
+        help="resume from a checkpoint instead of starting a new simulation",
+    )
+    parser.add_argument(
+        "--telemetry",
+        default=None,
+        help="directory to stream per-tick telemetry to",
+    )
+    parser.add_argument(
+        "--telemetry-interval",
+        type=int,
+        default=1,
+        help="record telemetry every this many ticks",
+    )
+    args = parser.parse_args()
+
+    run_headless(
+        num_ticks=args.ticks,
+        report_interval=args.report_interval,
+        collision_mode=CollisionMode(args.collision_mode),
+        seed=args.seed,
+        stats_path=args.stats_file,
+        stats_interval=args.stats_interval,
+        profile_path=args.profile,
+        checkpoint_path=args.checkpoint,
+        checkpoint_interval=args.checkpoint_every,
+        restore_path=args.restore,
+        telemetry_path=args.telemetry,
+        telemetry_interval=args.telemetry_interval,
+    )
+
+
+if __name__ == '__main__':
+    main()
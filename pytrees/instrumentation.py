@@ -0,0 +1,294 @@
+#############################################################################
+# MIT License
+
+# Copyright (c) 2023-2024 Chris Urffer
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#############################################################################
+
+
+import cProfile
+from collections import deque
+import csv
+import json
+import os
+import pstats
+import time
+from typing import Any, Optional
+
+import numpy as np
+
+
+class RollingWindow:
+
+    # The most recent values of a series, with a running sum so the mean is
+    # cheap enough to read every tick
+
+    def __init__(
+        self,
+        size: int,
+    ) -> None:
+        self._values: deque[float] = deque(maxlen=size)
+        self._sum = 0.0
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    def add(
+        self,
+        value: float,
+    ) -> None:
+        if len(self._values) == self._values.maxlen:
+            self._sum -= self._values[0]
+        self._values.append(value)
+        self._sum += value
+
+    @property
+    def last(self) -> float:
+        return self._values[-1] if self._values else 0.0
+
+    @property
+    def mean(self) -> float:
+        return self._sum / len(self._values) if self._values else 0.0
+
+    @property
+    def max(self) -> float:
+        return max(self._values) if self._values else 0.0
+
+
+class TickStats:
+
+    # Rolling per-phase timings and counters for the simulation loop, plus a
+    # cProfile hook that can be switched on and off while running
+
+    WINDOW_SIZE = 1000
+
+    # Trees with the most hits included in summary()
+    NUM_TOP_TREES = 10
+
+    def __init__(
+        self,
+        window_size: int = WINDOW_SIZE,
+    ) -> None:
+        self._window_size = window_size
+        self.phases: dict[str, RollingWindow] = {}
+        self.counters: dict[str, RollingWindow] = {}
+        self._tick_ends = RollingWindow(window_size)
+        self._tick_start = 0.0
+        self._lap_start = 0.0
+        self.num_ticks = 0
+
+        # Particles absorbed by each tree index over the window, built from
+        # the hit tree indices of each tick
+        self.tree_hits = np.zeros(0, dtype=np.int64)
+        self._tree_hit_ticks: deque[np.ndarray] = deque()
+        self._tick_tree_hits: list[np.ndarray] = []
+
+        self._profiler: Optional[cProfile.Profile] = None
+
+    # Timing
+    def begin(self) -> None:
+        self._tick_start = self._lap_start = time.perf_counter()
+
+    def lap(
+        self,
+        phase: str,
+    ) -> None:
+        # Attribute the time since begin() or the previous lap to phase
+        now = time.perf_counter()
+        self.record(phase, now - self._lap_start)
+        self._lap_start = now
+
+    def record(
+        self,
+        phase: str,
+        seconds: float,
+    ) -> None:
+        if phase not in self.phases:
+            self.phases[phase] = RollingWindow(self._window_size)
+        self.phases[phase].add(seconds)
+
+    def end_tick(self) -> None:
+        # Records the whole tick since begin() as the "tick" phase
+        now = time.perf_counter()
+        self.record("tick", now - self._tick_start)
+        self.num_ticks += 1
+        self._tick_ends.add(now)
+
+        hit_trees = (
+            np.concatenate(self._tick_tree_hits) if self._tick_tree_hits
+            else np.zeros(0, dtype=np.int64)
+        )
+        self._tick_tree_hits = []
+        self._tree_hit_ticks.append(hit_trees)
+        np.add.at(self.tree_hits, hit_trees, 1)
+        if len(self._tree_hit_ticks) > self._window_size:
+            np.subtract.at(self.tree_hits, self._tree_hit_ticks.popleft(), 1)
+
+    # Counters
+    def count(
+        self,
+        counter: str,
+        value: float,
+    ) -> None:
+        if counter not in self.counters:
+            self.counters[counter] = RollingWindow(self._window_size)
+        self.counters[counter].add(value)
+
+    def count_tree_hits(
+        self,
+        hit_trees: np.ndarray,
+        num_trees: int,
+    ) -> None:
+        # Hits are added to tree_hits when the tick ends
+        if len(self.tree_hits) < num_trees:
+            self.tree_hits = np.pad(self.tree_hits, (0, num_trees - len(self.tree_hits)))
+        self._tick_tree_hits.append(hit_trees)
+
+    # Profiling
+    @property
+    def profiling(self) -> bool:
+        return self._profiler is not None
+
+    def start_profiling(self) -> None:
+        if self._profiler is None:
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+
+    def stop_profiling(
+        self,
+        path: Optional[str] = None,
+    ) -> Optional[pstats.Stats]:
+        # Stop profiling, optionally dumping the profile to path in pstats
+        # format
+        if self._profiler is None:
+            return None
+        self._profiler.disable()
+        profile = pstats.Stats(self._profiler)
+        if path is not None:
+            profile.dump_stats(path)
+        self._profiler = None
+        return profile
+
+    # Reporting
+    def mean(
+        self,
+        name: str,
+    ) -> float:
+        # Rolling mean of a phase (in seconds) or counter, 0 if never seen
+        window = self.phases.get(name) or self.counters.get(name)
+        return window.mean if window is not None else 0.0
+
+    @property
+    def ticks_per_sec(self) -> float:
+        if len(self._tick_ends) < 2:
+            return 0.0
+        values = self._tick_ends._values
+        elapsed = values[-1] - values[0]
+        return (len(values) - 1) / elapsed if elapsed > 0 else 0.0
+
+    def top_trees(
+        self,
+        num_trees: int = NUM_TOP_TREES,
+    ) -> list[tuple[int, int]]:
+        # (tree index, hits over the window) of the trees with the most hits
+        order = np.argsort(-self.tree_hits, kind="stable")[:num_trees]
+        order = order[self.tree_hits[order] > 0]
+        return list(zip(order.tolist(), self.tree_hits[order].tolist()))
+
+    def summary(self) -> dict[str, Any]:
+        return {
+            "time": time.time(),
+            "num_ticks": self.num_ticks,
+            "ticks_per_sec": self.ticks_per_sec,
+            "phases_ms": {
+                phase: {
+                    "mean": window.mean * 1000,
+                    "max": window.max * 1000,
+                }
+                for phase, window in self.phases.items()
+            },
+            "counters": {
+                counter: {
+                    "mean": window.mean,
+                    "last": window.last,
+                }
+                for counter, window in self.counters.items()
+            },
+            "top_trees": self.top_trees(),
+        }
+
+
+class StatsDumper:
+
+    # Appends a TickStats summary to a file at most once per interval, as
+    # JSON lines or as CSV rows depending on the file extension
+
+    def __init__(
+        self,
+        stats: TickStats,
+        path: str,
+        interval: float = 10.0,
+    ) -> None:
+        self._stats = stats
+        self._path = path
+        self._interval = interval
+        self._last_dump = time.time()
+        self._csv = path.endswith(".csv")
+        self._csv_columns: Optional[list[str]] = None
+
+    def maybe_dump(self) -> bool:
+        now = time.time()
+        if now - self._last_dump < self._interval:
+            return False
+        self._last_dump = now
+        self.dump()
+        return True
+
+    def dump(self) -> None:
+        summary = self._stats.summary()
+        if not self._csv:
+            with open(self._path, "a") as f:
+                f.write(json.dumps(summary) + "\n")
+            return
+
+        # Flatten nested stats into columns; the first dump fixes the columns
+        row: dict[str, Any] = {
+            "time": summary["time"],
+            "num_ticks": summary["num_ticks"],
+            "ticks_per_sec": summary["ticks_per_sec"],
+        }
+        for phase, values in summary["phases_ms"].items():
+            row[f"{phase}_mean_ms"] = values["mean"]
+            row[f"{phase}_max_ms"] = values["max"]
+        for counter, values in summary["counters"].items():
+            row[f"{counter}_mean"] = values["mean"]
+        top_trees = summary["top_trees"]
+        for rank in range(TickStats.NUM_TOP_TREES):
+            index, hits = top_trees[rank] if rank < len(top_trees) else (-1, 0)
+            row[f"top_tree_{rank + 1}"] = index
+            row[f"top_tree_{rank + 1}_hits"] = hits
+        if self._csv_columns is None:
+            self._csv_columns = list(row)
+        write_header = not os.path.exists(self._path)
+        with open(self._path, "a", newline="") as f:
+            writer = csv.DictWriter(f, self._csv_columns, extrasaction="ignore")
+            if write_header:
+                writer.writeheader()
+            writer.writerow(row)
@@ -24,20 +24,6 @@
 
 
 import abc
-from typing import Optional
-
-from pytrees.utils import Pos
-
-
-class Drawable(abc.ABC):
-
-    @abc.abstractmethod
-    def draw(
-        self,
-        display: "PyTreesDisplay",
-        offset: Optional[Pos] = None
-    ) -> None:
-        raise NotImplementedError()
 
 
 class Tickable(abc.ABC):
@@ -47,6 +33,3 @@ class Tickable(abc.ABC):
         self,
     ) -> None:
         raise NotImplementedError()
-
-
-from pytrees.display import PyTreesDisplay
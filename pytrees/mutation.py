@@ -34,3 +34,43 @@ MIN_NODE_SIZE = 5
 
 CHANCE_NODE_DELETE = 0.10
 CHANCE_NODE_ADD = 0.30
+
+
+class MutationConfig:
+
+    # The constants above as a per-instance config, so runs in the same
+    # interpreter can mutate trees differently. Unset values fall back to the
+    # module constants as they are when the config is made.
+
+    NAMES = (
+        "CHANCE_NODE_TYPE",
+        "CHANCE_NODE_TYPE_STRUCT",
+        "CHANCE_NODE_ANGLE",
+        "CHANCE_NODE_DISTANCE",
+        "MIN_NODE_DISTANCE",
+        "CHANCE_NODE_SIZE",
+        "MIN_NODE_SIZE",
+        "CHANCE_NODE_DELETE",
+        "CHANCE_NODE_ADD",
+    )
+
+    def __init__(
+        self,
+        **overrides: float,
+    ) -> None:
+        unknown = set(overrides) - set(self.NAMES)
+        if unknown:
+            raise ValueError(f"unknown mutation parameters: {sorted(unknown)}")
+        for name in self.NAMES:
+            setattr(self, name, overrides.get(name, globals()[name]))
+
+    def __eq__(self, __value: object) -> bool:
+        if type(__value) is not MutationConfig:
+            return False
+        return self.as_dict() == __value.as_dict()
+
+    def __repr__(self) -> str:
+        return f"MutationConfig({self.as_dict()})"
+
+    def as_dict(self) -> dict[str, float]:
+        return {name: getattr(self, name) for name in self.NAMES}
@@ -0,0 +1,370 @@
+#############################################################################
+# MIT License
+
+# Copyright (c) 2023-2024 Chris Urffer
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#############################################################################
+
+
+from enum import Enum
+import heapq
+from typing import Iterator, Optional
+
+import numpy as np
+
+from pytrees.utils import Pos, PyTreeColor
+
+
+class ParticleType(Enum):
+    SUN = 0
+    WATER = 1
+
+
+class Particle(Pos):
+
+    # Read-only snapshot of one particle in a ParticleStore. A particle's
+    # identity is its integer id, which stays the same as it falls.
+    __slots__ = ("id", "power", "spent")
+
+    COLOR: PyTreeColor
+    POWER_BASE: int
+    POWER_INC_PER_TICK: int
+
+    diameter = 5
+
+    id: int
+    power: int
+    spent: bool
+
+    def __init__(
+        self,
+        id: int,
+        x: int, y: int,
+        power: Optional[int] = None,
+        spent: bool = False,
+    ) -> None:
+        super().__init__(x, y)
+        _set_id(self, id)
+        _set_power(self, self.POWER_BASE if power is None else power)
+        _set_spent(self, spent)
+
+    def __reduce__(self) -> tuple:
+        return (type(self), (self.id, self.x, self.y, self.power, self.spent))
+
+    # Equality
+    def __eq__(self, __value: object) -> bool:
+        return isinstance(__value, Particle) and self.id == __value.id
+
+    def __ne__(self, __value: object) -> bool:
+        return not self == __value
+
+    # Meta
+    def __hash__(self) -> int:
+        return hash(self.id)
+
+
+# Slot setters, as for Pos
+_set_id = Particle.id.__set__  # type: ignore[attr-defined]
+_set_power = Particle.power.__set__  # type: ignore[attr-defined]
+_set_spent = Particle.spent.__set__  # type: ignore[attr-defined]
+
+
+class ParticleSun(Particle):
+
+    __slots__ = ()
+
+    COLOR = PyTreeColor.YELLOW
+    POWER_BASE = 70000
+    POWER_INC_PER_TICK = -45
+
+
+class ParticleRain(Particle):
+
+    __slots__ = ()
+
+    COLOR = PyTreeColor.BLUE
+    POWER_BASE = -50000
+    POWER_INC_PER_TICK = 55
+
+
+# Particle class used to build a view of each particle type, indexed by the
+# type's value
+PARTICLE_CLASSES: list[type[Particle]] = [ParticleSun, ParticleRain]
+
+
+class ParticleStore:
+
+    INITIAL_CAPACITY = 1024
+
+    _COLUMNS = ("_id", "_birth", "_x", "_y", "_power", "_type", "_alive")
+
+    # Per-type constants, indexed by ParticleType value
+    _POWER_BASE = np.array(
+        [cls.POWER_BASE for cls in PARTICLE_CLASSES],
+        dtype=np.int64,
+    )
+    _POWER_INC_PER_TICK = np.array(
+        [cls.POWER_INC_PER_TICK for cls in PARTICLE_CLASSES],
+        dtype=np.int64,
+    )
+
+    def __init__(
+        self,
+        capacity: int = INITIAL_CAPACITY,
+    ) -> None:
+        # Structure-of-arrays storage. Only the first self._size entries of
+        # each array hold particles; the rest is spare capacity. Particles
+        # are kept in spawn order, so ids are always ascending.
+        self._size = 0
+        self._next_id = 0
+        self._id = np.zeros(capacity, dtype=np.int64)
+        self._birth = np.zeros(capacity, dtype=np.int64)
+        self._x = np.zeros(capacity, dtype=np.int64)
+        self._y = np.zeros(capacity, dtype=np.int64)
+        self._power = np.zeros(capacity, dtype=np.int64)
+        self._type = np.zeros(capacity, dtype=np.int8)
+        self._alive = np.zeros(capacity, dtype=np.bool_)
+
+    def __len__(self) -> int:
+        return self._size
+
+    # Views onto the live portion of each column
+    @property
+    def ids(self) -> np.ndarray:
+        return self._id[:self._size]
+
+    @property
+    def births(self) -> np.ndarray:
+        return self._birth[:self._size]
+
+    @property
+    def xs(self) -> np.ndarray:
+        return self._x[:self._size]
+
+    @property
+    def ys(self) -> np.ndarray:
+        return self._y[:self._size]
+
+    @property
+    def powers(self) -> np.ndarray:
+        return self._power[:self._size]
+
+    @property
+    def types(self) -> np.ndarray:
+        return self._type[:self._size]
+
+    @property
+    def alive(self) -> np.ndarray:
+        return self._alive[:self._size]
+
+    def _reserve(
+        self,
+        capacity: int,
+    ) -> None:
+        if capacity <= len(self._x):
+            return
+        new_capacity = max(capacity, len(self._x) * 2)
+        for name in self._COLUMNS:
+            old = getattr(self, name)
+            new = np.zeros(new_capacity, dtype=old.dtype)
+            new[:self._size] = old[:self._size]
+            setattr(self, name, new)
+
+    def spawn(
+        self,
+        xs: np.ndarray,
+        type: ParticleType,
+        tick: int,
+        y: int = 0,
+    ) -> np.ndarray:
+        # Add particles at the given y, spawned on the given tick. Returns the
+        # indices of the new particles.
+        num_new = len(xs)
+        self._reserve(self._size + num_new)
+        new = slice(self._size, self._size + num_new)
+        self._id[new] = self.allocate_ids(num_new)
+        self._birth[new] = tick - y
+        self._x[new] = xs
+        self._y[new] = y
+        self._power[new] = (
+            self._POWER_BASE[type.value] +
+            self._POWER_INC_PER_TICK[type.value] * y
+        )
+        self._type[new] = type.value
+        self._alive[new] = True
+        self._size += num_new
+        return np.arange(new.start, new.stop)
+
+    def allocate_ids(
+        self,
+        num_ids: int,
+    ) -> np.ndarray:
+        # Reserve the next num_ids particle ids
+        ids = np.arange(self._next_id, self._next_id + num_ids)
+        self._next_id += num_ids
+        return ids
+
+    def append(
+        self,
+        ids: np.ndarray,
+        births: np.ndarray,
+        xs: np.ndarray,
+        types: np.ndarray,
+        tick: int,
+    ) -> None:
+        # Add live particles that were spawned on earlier ticks, placed where
+        # they are after the given tick. Their ids must be ascending and
+        # already allocated, e.g. by allocate_ids.
+        num_new = len(ids)
+        self._reserve(self._size + num_new)
+        new = slice(self._size, self._size + num_new)
+        self._id[new] = ids
+        self._birth[new] = births
+        self._x[new] = xs
+        self._y[new] = tick - births
+        self._power[new] = self.power_at(types, tick - births)
+        self._type[new] = types
+        self._alive[new] = True
+        self._size += num_new
+
+    def advance(self) -> None:
+        # Move every particle down one pixel and apply its per-tick power change
+        self.ys[:] += 1
+        self.powers[:] += self._POWER_INC_PER_TICK[self.types]
+
+    def sync(
+        self,
+        tick: int,
+    ) -> None:
+        # Set every particle's position and power to where it would be after
+        # the given tick, without stepping it there one tick at a time
+        self.ys[:] = tick - self.births
+        self.powers[:] = self.power_at(self.types, self.ys)
+
+    @classmethod
+    def power_at(
+        cls,
+        types: np.ndarray,
+        ys: np.ndarray,
+    ) -> np.ndarray:
+        # Power changes linearly as a particle falls, so it is a function of
+        # the particle's type and height alone
+        return cls._POWER_BASE[types] + cls._POWER_INC_PER_TICK[types] * ys
+
+    def index_of(
+        self,
+        ids: np.ndarray,
+    ) -> np.ndarray:
+        return np.searchsorted(self.ids, ids)
+
+    def kill(
+        self,
+        mask: np.ndarray,
+    ) -> None:
+        self.alive[mask] = False
+
+    def cull(self) -> None:
+        # Compact the store, dropping every particle that is no longer alive
+        alive = self.alive.copy()
+        num_alive = int(np.count_nonzero(alive))
+        if num_alive == self._size:
+            return
+        for name in self._COLUMNS:
+            column = getattr(self, name)
+            column[:num_alive] = column[:self._size][alive]
+        self._size = num_alive
+
+    def view(
+        self,
+        index: int,
+    ) -> Particle:
+        return PARTICLE_CLASSES[self._type[index]](
+            int(self._id[index]),
+            int(self._x[index]),
+            int(self._y[index]),
+            int(self._power[index]),
+            not self._alive[index],
+        )
+
+    def views(
+        self,
+        type: Optional[ParticleType] = None,
+    ) -> Iterator[Particle]:
+        for i in range(self._size):
+            if type is None or self._type[i] == type.value:
+                yield self.view(i)
+
+
+class AbsorptionQueue:
+
+    # Time-ordered queue of particle absorption events. Each heap entry holds
+    # every event due on one tick for one scheduling batch.
+
+    def __init__(self) -> None:
+        self._heap: list[tuple[int, int, np.ndarray, np.ndarray, np.ndarray]] = []
+        self._seq = 0
+
+    def __len__(self) -> int:
+        return sum(len(entry[2]) for entry in self._heap)
+
+    def clear(self) -> None:
+        self._heap.clear()
+
+    def schedule(
+        self,
+        ticks: np.ndarray,
+        ids: np.ndarray,
+        trees: np.ndarray,
+        powers: np.ndarray,
+    ) -> None:
+        # Schedule particle ids to be absorbed on the given ticks, giving
+        # their power to the given tree indices (-1 for no tree)
+        order = np.argsort(ticks, kind="stable")
+        ticks, ids, trees, powers = (
+            ticks[order], ids[order], trees[order], powers[order]
+        )
+        due_ticks, starts = np.unique(ticks, return_index=True)
+        ends = np.append(starts[1:], len(ticks))
+        for tick, start, end in zip(due_ticks.tolist(), starts, ends):
+            heapq.heappush(self._heap, (
+                tick,
+                self._seq,
+                ids[start:end],
+                trees[start:end],
+                powers[start:end],
+            ))
+            self._seq += 1
+
+    def pop_due(
+        self,
+        tick: int,
+    ) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        # Remove and return (ids, trees, powers) of every event due by tick
+        due = []
+        while self._heap and self._heap[0][0] <= tick:
+            due.append(heapq.heappop(self._heap))
+        if not due:
+            empty = np.zeros(0, dtype=np.int64)
+            return empty, empty, empty
+        return (
+            np.concatenate([entry[2] for entry in due]),
+            np.concatenate([entry[3] for entry in due]),
+            np.concatenate([entry[4] for entry in due]),
+        )
@@ -0,0 +1,202 @@
+#############################################################################
+# MIT License
+
+# Copyright (c) 2023-2024 Chris Urffer
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#############################################################################
+
+
+# Finds what is drawn at a world position of a RenderFrame, for clicks and
+# hover in the display. Node circles and tree bounds are bucketed into
+# uniform grids of square cells, so a pick only tests the shapes in one cell
+# instead of every tree.
+
+from typing import Optional
+
+import numpy as np
+
+from pytrees.transport import RenderFrame
+from pytrees.utils import Pos
+
+
+class _BoxGrid:
+
+    # Boxes entered into every grid cell they overlap, packed into one array
+    # sorted by cell. Within a cell, boxes stay in ascending index order.
+
+    def __init__(
+        self,
+        lefts: np.ndarray,
+        tops: np.ndarray,
+        rights: np.ndarray,
+        bottoms: np.ndarray,
+        cell_size: int,
+    ) -> None:
+        self._cell_size = cell_size
+        if len(lefts) == 0:
+            self._col_min = self._row_min = 0
+            self._num_cols = self._num_rows = 0
+            self._cell_starts = np.zeros(1, dtype=np.int64)
+            self._entries = np.zeros(0, dtype=np.int64)
+            return
+
+        col_lo = lefts // cell_size
+        col_hi = np.maximum(rights // cell_size, col_lo)
+        row_lo = tops // cell_size
+        row_hi = np.maximum(bottoms // cell_size, row_lo)
+        self._col_min = int(col_lo.min())
+        self._row_min = int(row_lo.min())
+        self._num_cols = int(col_hi.max()) - self._col_min + 1
+        self._num_rows = int(row_hi.max()) - self._row_min + 1
+
+        # Expand each box into one entry per covered cell, row by row
+        widths = col_hi - col_lo + 1
+        spans = widths * (row_hi - row_lo + 1)
+        box_of_entry = np.repeat(np.arange(len(lefts)), spans)
+        within = np.arange(len(box_of_entry)) - (np.cumsum(spans) - spans)[box_of_entry]
+        cols = col_lo[box_of_entry] - self._col_min + within % widths[box_of_entry]
+        rows = row_lo[box_of_entry] - self._row_min + within // widths[box_of_entry]
+        cells = rows * self._num_cols + cols
+
+        order = np.argsort(cells, kind="stable")
+        self._entries = box_of_entry[order]
+        self._cell_starts = np.zeros(self._num_cols * self._num_rows + 1, dtype=np.int64)
+        np.cumsum(
+            np.bincount(cells, minlength=self._num_cols * self._num_rows),
+            out=self._cell_starts[1:],
+        )
+
+    def candidates(
+        self,
+        x: int,
+        y: int,
+    ) -> np.ndarray:
+        # Indices of every box that may contain (x, y)
+        col = x // self._cell_size - self._col_min
+        row = y // self._cell_size - self._row_min
+        if not (0 <= col < self._num_cols and 0 <= row < self._num_rows):
+            return self._entries[:0]
+        cell = row * self._num_cols + col
+        return self._entries[self._cell_starts[cell]:self._cell_starts[cell + 1]]
+
+
+class FramePicker:
+
+    CELL_SIZE = 64
+
+    def __init__(
+        self,
+        cell_size: int = CELL_SIZE,
+    ) -> None:
+        self._cell_size = cell_size
+        self._frame: Optional[RenderFrame] = None
+
+        # Indexes of the current frame, built on the first pick after it
+        # arrives
+        self._dirty = False
+        self._node_grid: Optional[_BoxGrid] = None
+        self._tree_grid: Optional[_BoxGrid] = None
+        self._node_trees = np.zeros(0, dtype=np.int64)
+
+    def update(
+        self,
+        frame: RenderFrame,
+    ) -> None:
+        # Pick from a new frame from now on. Cheap to call on every frame.
+        if frame is not self._frame:
+            self._frame = frame
+            self._dirty = True
+
+    def _build(self) -> None:
+        assert self._frame is not None
+        self._dirty = False
+        trees = self._frame.trees
+        nodes = self._frame.nodes
+
+        xs = nodes[:, RenderFrame.NODE_X]
+        ys = nodes[:, RenderFrame.NODE_Y]
+        sizes = nodes[:, RenderFrame.NODE_SIZE]
+        self._node_grid = _BoxGrid(
+            xs - sizes, ys - sizes, xs + sizes, ys + sizes,
+            self._cell_size,
+        )
+        self._tree_grid = _BoxGrid(
+            trees[:, RenderFrame.TREE_LEFT],
+            trees[:, RenderFrame.TREE_TOP],
+            trees[:, RenderFrame.TREE_RIGHT],
+            trees[:, RenderFrame.TREE_BOTTOM],
+            self._cell_size,
+        )
+
+        # Tree index of every node; nodes are grouped by tree in tree order
+        self._node_trees = np.repeat(
+            np.arange(len(trees)),
+            trees[:, RenderFrame.TREE_NODE_COUNT],
+        )
+
+    def pick(
+        self,
+        pos: Pos,
+    ) -> Optional[tuple[int, Optional[int]]]:
+        # (tree index, node row) of what is drawn on top at a world position.
+        # The node row is None if pos is inside a tree's bounds but on no
+        # node, and None is returned if pos is on no tree at all.
+        if self._frame is None:
+            return None
+        if self._dirty:
+            self._build()
+        assert self._node_grid is not None and self._tree_grid is not None
+        nodes = self._frame.nodes
+        trees = self._frame.trees
+
+        rows = self._node_grid.candidates(pos.x, pos.y)
+        if len(rows):
+            dx = nodes[rows, RenderFrame.NODE_X] - pos.x
+            dy = nodes[rows, RenderFrame.NODE_Y] - pos.y
+            sizes = nodes[rows, RenderFrame.NODE_SIZE]
+            hits = rows[dx*dx + dy*dy <= sizes*sizes]
+            if len(hits):
+                # Later trees are drawn over earlier ones, and a tree's
+                # nodes over the nodes after them
+                hit_trees = self._node_trees[hits]
+                top_tree = hit_trees.max()
+                return int(top_tree), int(hits[hit_trees == top_tree].min())
+
+        indices = self._tree_grid.candidates(pos.x, pos.y)
+        bounds = trees[indices]
+        indices = indices[
+            (bounds[:, RenderFrame.TREE_LEFT] <= pos.x) &
+            (pos.x <= bounds[:, RenderFrame.TREE_RIGHT]) &
+            (bounds[:, RenderFrame.TREE_TOP] <= pos.y) &
+            (pos.y <= bounds[:, RenderFrame.TREE_BOTTOM])
+        ]
+        if len(indices) <= 1:
+            return (int(indices[0]), None) if len(indices) else None
+
+        # Overlapping bounds: take the tree whose nodes come closest to pos
+        gaps = []
+        for index in indices.tolist():
+            tree_nodes = self._frame.tree_nodes(index)
+            dx = tree_nodes[:, RenderFrame.NODE_X] - pos.x
+            dy = tree_nodes[:, RenderFrame.NODE_Y] - pos.y
+            gaps.append(float(np.min(
+                np.sqrt(dx*dx + dy*dy) - tree_nodes[:, RenderFrame.NODE_SIZE]
+            )))
+        return int(indices[int(np.argmin(gaps))]), None
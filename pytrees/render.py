@@ -0,0 +1,421 @@
+#############################################################################
+# MIT License
+
+# Copyright (c) 2023-2024 Chris Urffer
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#############################################################################
+
+
+from typing import TYPE_CHECKING, Optional
+import weakref
+
+import numpy as np
+import pygame
+
+from pytrees.particles import PARTICLE_CLASSES, Particle
+from pytrees.transport import RenderFrame, RenderStatic
+from pytrees.tree import NODE_TYPES
+from pytrees.utils import Pos, PyTreeColor
+
+if TYPE_CHECKING:
+    from pytrees.display import PyTreesDisplay
+
+
+# Dict for cacheing existing fonts of a size
+font_dict: dict[int, pygame.font.Font] = {}
+
+# Pre-rendered landscape for each RenderStatic, as (surface, top). The
+# surface covers the world from the highest ground level down.
+landscape_cache: "weakref.WeakKeyDictionary[RenderStatic, tuple[pygame.Surface, int]]" = (
+    weakref.WeakKeyDictionary()
+)
+
+# Sprite of each particle type, built on first use
+particle_sprite_cache: list[pygame.Surface] = []
+
+# Fill colour of the transparent parts of cached surfaces
+COLORKEY = (255, 0, 255)
+
+# Pixels around a tree's bounds included in its sprite, so the edges of its
+# node circles aren't clipped
+TREE_SPRITE_MARGIN = 2
+
+# How far outside the window something can be and still be partly visible,
+# normally and with debug text drawn next to it
+CULL_MARGIN = 3
+CULL_MARGIN_DEBUG = 80
+
+
+def draw_text(
+    surface: pygame.Surface,
+    left_top: Pos,
+    text: str,
+    fontsize: int,
+    color: PyTreeColor = PyTreeColor.BLACK,
+):
+    # Create a font if one does not yet exist
+    if fontsize not in font_dict:
+        font_dict[fontsize] = pygame.font.Font('freesansbold.ttf', fontsize)
+    font = font_dict[fontsize]
+
+    # Render some text on a new surface
+    text_surface = font.render(text, True, color.value)
+
+    # Get the rectangular bounds of the text surface
+    text_surface_bounds = text_surface.get_rect()
+
+    # Set an anchor for this text surface's bounds
+    text_surface_bounds.topleft = left_top.tuple()
+
+    # Copy the text surface to the main surface
+    surface.blit(text_surface, text_surface_bounds)
+
+
+def draw_frame(
+    display: "PyTreesDisplay",
+    static: RenderStatic,
+    frame: RenderFrame,
+    offset: Optional[Pos] = None,
+) -> None:
+    if offset is None:
+        offset = display.offset
+
+    # Draw background
+    display.surface.fill(color=PyTreeColor.SKY_BLUE.value)
+
+    # Draw bounding box
+    pygame.draw.rect(
+        surface=display.surface,
+        color=PyTreeColor.BLACK.value,
+        rect=pygame.Rect(
+            (-offset).tuple(),
+            static.dims.tuple(),
+        ),
+        width=1,
+    )
+
+    # Draw landscape
+    draw_landscape(display, static, offset)
+
+    # Draw trees
+    for index in visible_trees(display, frame, offset).tolist():
+        draw_tree(display, frame, index, offset)
+
+    # Forget the sprites of trees that no longer exist
+    if len(display.tree_sprites) > len(frame.trees):
+        keys = set(frame.trees[:, RenderFrame.TREE_KEY].tolist())
+        for key in list(display.tree_sprites):
+            if key not in keys:
+                del display.tree_sprites[key]
+
+    # Draw particles
+    draw_particles(display, frame, offset)
+
+
+def visible_rect(
+    display: "PyTreesDisplay",
+    offset: Pos,
+) -> pygame.Rect:
+    # The part of the world shown in the window, grown by the cull margin
+    margin = CULL_MARGIN_DEBUG if display.debug else CULL_MARGIN
+    width, height = display.surface.get_size()
+    return pygame.Rect(
+        offset.x - margin, offset.y - margin,
+        width + 2*margin, height + 2*margin,
+    )
+
+
+def visible_trees(
+    display: "PyTreesDisplay",
+    frame: RenderFrame,
+    offset: Pos,
+) -> np.ndarray:
+    # Indices of the trees whose bounds overlap the window
+    view = visible_rect(display, offset)
+    trees = frame.trees
+    return np.flatnonzero(
+        (trees[:, RenderFrame.TREE_LEFT] < view.right) &
+        (trees[:, RenderFrame.TREE_RIGHT] >= view.left) &
+        (trees[:, RenderFrame.TREE_TOP] < view.bottom) &
+        (trees[:, RenderFrame.TREE_BOTTOM] >= view.top)
+    )
+
+
+def draw_stats(
+    display: "PyTreesDisplay",
+    frame: RenderFrame,
+) -> None:
+    # Simulation stats, one per line in the top left corner of the window
+    lines = [f"tick {frame.tick}"] + [
+        f"{name} {value}" for name, value in frame.stats.items()
+    ]
+    for i, line in enumerate(lines):
+        draw_text(
+            surface=display.surface,
+            left_top=Pos(5, 5 + i * 14),
+            text=line,
+            fontsize=12,
+        )
+
+
+def draw_landscape(
+    display: "PyTreesDisplay",
+    static: RenderStatic,
+    offset: Optional[Pos] = None,
+) -> None:
+    if offset is None:
+        offset = display.offset
+
+    if static not in landscape_cache:
+        landscape_cache[static] = render_landscape(static)
+    landscape, top = landscape_cache[static]
+
+    # Only blit the columns and rows in the window
+    view = visible_rect(display, offset).clip(landscape.get_rect(top=top))
+    if view.width > 0 and view.height > 0:
+        display.surface.blit(
+            landscape,
+            (view.left - offset.x, view.top - offset.y),
+            area=view.move(0, -top),
+        )
+
+
+def render_landscape(
+    static: RenderStatic,
+) -> tuple[pygame.Surface, int]:
+    # Draw one line per column of the world into a surface that starts at
+    # the highest ground level, with everything above the ground transparent
+    levels = static.ground_levels.tolist()
+    top = min(levels, default=static.dims.y)
+    surface = pygame.Surface((len(levels), static.dims.y - top + 1)).convert()
+    surface.fill(COLORKEY)
+    for i, level in enumerate(levels):
+        pygame.draw.line(
+            surface=surface,
+            color=PyTreeColor.BROWN.value,
+            start_pos=(i, level - top),
+            end_pos=(i, static.dims.y - top),
+        )
+    surface.set_colorkey(COLORKEY, pygame.RLEACCEL)
+    return surface, top
+
+
+def draw_particles(
+    display: "PyTreesDisplay",
+    frame: RenderFrame,
+    offset: Optional[Pos] = None,
+) -> None:
+    if offset is None:
+        offset = display.offset
+
+    # Only draw the particles in the window
+    view = visible_rect(display, offset)
+    particles = frame.particles
+    xs = particles[:, RenderFrame.PARTICLE_X]
+    ys = particles[:, RenderFrame.PARTICLE_Y]
+    particles = particles[
+        (xs >= view.left) & (xs < view.right) &
+        (ys >= view.top) & (ys < view.bottom)
+    ]
+
+    # Particles are drawn centred on their position
+    radius = Particle.diameter // 2
+    xs = (particles[:, RenderFrame.PARTICLE_X] - (offset.x + radius)).tolist()
+    ys = (particles[:, RenderFrame.PARTICLE_Y] - (offset.y + radius)).tolist()
+    types = particles[:, RenderFrame.PARTICLE_TYPE].tolist()
+
+    if not display.debug:
+        # Blit every particle's sprite in one call, keeping the store order
+        # so overlapping particles stack the same way
+        sprites = particle_sprites()
+        display.surface.blits(
+            [(sprites[type], (x, y)) for x, y, type in zip(xs, ys, types)],
+            doreturn=False,
+        )
+        return
+
+    colors = [cls.COLOR.value for cls in PARTICLE_CLASSES]
+    powers = particles[:, RenderFrame.PARTICLE_POWER].tolist()
+    for x, y, type, power in zip(xs, ys, types, powers):
+        pygame.draw.rect(
+            surface=display.surface,
+            color=colors[type],
+            rect=pygame.Rect(x, y, Particle.diameter, Particle.diameter),
+        )
+        draw_text(
+            surface=display.surface,
+            left_top=Pos(x + radius, y + radius),
+            text=str(power),
+            fontsize=10,
+        )
+
+
+def particle_sprites() -> list[pygame.Surface]:
+    # One filled square per particle type, indexed by the type's value
+    if not particle_sprite_cache:
+        for cls in PARTICLE_CLASSES:
+            sprite = pygame.Surface((Particle.diameter, Particle.diameter)).convert()
+            sprite.fill(cls.COLOR.value)
+            particle_sprite_cache.append(sprite)
+    return particle_sprite_cache
+
+
+def draw_tree(
+    display: "PyTreesDisplay",
+    frame: RenderFrame,
+    index: int,
+    offset: Optional[Pos] = None,
+) -> None:
+    if offset is None:
+        offset = display.offset
+
+    _, energy, left, top, right, bottom, _, _, version = frame.trees[index].tolist()
+    if not display.debug:
+        # Blit the tree's sprite, redrawing it only if the tree has changed
+        key = int(frame.trees[index, RenderFrame.TREE_KEY])
+        cached = display.tree_sprites.get(key)
+        if cached is None or cached[0] != version:
+            cached = (version, render_tree(frame, index))
+            display.tree_sprites[key] = cached
+        display.surface.blit(
+            cached[1],
+            (left - TREE_SPRITE_MARGIN - offset.x, top - TREE_SPRITE_MARGIN - offset.y),
+        )
+        return
+
+    # Debug drawing changes every frame, so isn't cached
+    _draw_tree_shapes(display.surface, frame, index, offset.x, offset.y, debug=True)
+    pygame.draw.rect(
+        surface=display.surface,
+        color=PyTreeColor.BLACK.value,
+        rect=pygame.Rect(
+            left - offset.x, top - offset.y,
+            right - left, bottom - top,
+        ),
+        width=1,
+    )
+    draw_text(
+        surface=display.surface,
+        left_top=Pos(left - offset.x, top - offset.y),
+        text=str(energy),
+        fontsize=10,
+    )
+
+
+def draw_highlight(
+    display: "PyTreesDisplay",
+    frame: RenderFrame,
+    index: int,
+    node_row: Optional[int] = None,
+    offset: Optional[Pos] = None,
+) -> None:
+    # Outline a tree's bounds and, if given, one of its nodes
+    if offset is None:
+        offset = display.offset
+
+    _, _, left, top, right, bottom, _, _, _ = frame.trees[index].tolist()
+    pygame.draw.rect(
+        surface=display.surface,
+        color=PyTreeColor.WHITE.value,
+        rect=pygame.Rect(
+            left - offset.x, top - offset.y,
+            right - left, bottom - top,
+        ),
+        width=1,
+    )
+    if node_row is not None:
+        x, y, size, _, _ = frame.nodes[node_row].tolist()
+        pygame.draw.circle(
+            surface=display.surface,
+            color=PyTreeColor.WHITE.value,
+            center=(x - offset.x, y - offset.y),
+            radius=size + 2,
+            width=2,
+        )
+
+
+def render_tree(
+    frame: RenderFrame,
+    index: int,
+) -> pygame.Surface:
+    # Draw a tree into a sprite covering its bounds plus a margin, with
+    # everything but the tree transparent
+    _, _, left, top, right, bottom, _, _, _ = frame.trees[index].tolist()
+    surface = pygame.Surface((
+        right - left + 2*TREE_SPRITE_MARGIN + 1,
+        bottom - top + 2*TREE_SPRITE_MARGIN + 1,
+    )).convert()
+    surface.fill(COLORKEY)
+    _draw_tree_shapes(
+        surface, frame, index,
+        left - TREE_SPRITE_MARGIN, top - TREE_SPRITE_MARGIN,
+        debug=False,
+    )
+    surface.set_colorkey(COLORKEY, pygame.RLEACCEL)
+    return surface
+
+
+def _draw_tree_shapes(
+    surface: pygame.Surface,
+    frame: RenderFrame,
+    index: int,
+    offset_x: int,
+    offset_y: int,
+    debug: bool,
+) -> None:
+    nodes = frame.tree_nodes(index).tolist()
+    first_node = frame.trees[index, RenderFrame.TREE_NODE_START]
+
+    # Draw the branches, then the nodes with every child before its parent
+    for x, y, _, _, parent in nodes:
+        if parent >= 0:
+            parent_x, parent_y = nodes[parent - first_node][:2]
+            pygame.draw.line(
+                surface=surface,
+                color=PyTreeColor.BLACK.value,
+                start_pos=(parent_x - offset_x, parent_y - offset_y),
+                end_pos=(x - offset_x, y - offset_y),
+            )
+    for x, y, size, type, _ in reversed(nodes):
+        _draw_tree_node(surface, x - offset_x, y - offset_y, size, type, debug)
+
+
+def _draw_tree_node(
+    surface: pygame.Surface,
+    x: int,
+    y: int,
+    size: int,
+    type: int,
+    debug: bool,
+) -> None:
+    # Draw a node centred on surface position (x, y)
+    pygame.draw.circle(
+        surface=surface,
+        color=NODE_TYPES[type].value.value,
+        center=(x, y),
+        radius=size,
+    )
+    if debug:
+        pygame.draw.rect(
+            surface=surface,
+            color=PyTreeColor.BLACK.value,
+            rect=pygame.Rect(x - size, y - size, size*2, size*2),
+            width=1,
+        )
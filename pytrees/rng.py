@@ -0,0 +1,132 @@
+#############################################################################
+# MIT License
+
+# Copyright (c) 2023-2024 Chris Urffer
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#############################################################################
+
+
+from typing import Any, Optional, Sequence, TypeVar, Union
+
+import numpy as np
+
+
+T = TypeVar("T")
+
+Seed = Union[None, int, np.random.SeedSequence]
+
+
+class RandomStream:
+
+    # A seeded random stream backed by a numpy Generator. Scalar draws are
+    # served from a buffer filled in bulk, so hot paths like TreeNode.mutate
+    # don't pay for a numpy call per random number.
+
+    BUFFER_SIZE = 1024
+
+    def __init__(
+        self,
+        seed: Seed = None,
+    ) -> None:
+        if not isinstance(seed, np.random.SeedSequence):
+            seed = np.random.SeedSequence(seed)
+        self._seed_sequence = seed
+        self.generator = np.random.Generator(np.random.PCG64(seed))
+
+        self._buffer: list[float] = []
+        self._index = 0
+
+    def spawn(
+        self,
+        num_streams: int,
+    ) -> list["RandomStream"]:
+        # Independent child streams that don't overlap with this one
+        return [
+            RandomStream(child)
+            for child in self._seed_sequence.spawn(num_streams)
+        ]
+
+    def get_state(self) -> dict[str, Any]:
+        # Everything needed to resume the stream exactly where it is,
+        # including scalar draws still waiting in the buffer
+        seed_sequence = self._seed_sequence
+        return {
+            "bit_generator": self.generator.bit_generator.state,
+            "buffer": np.array(self._buffer[self._index:], dtype=np.float64),
+            "seed_sequence": {
+                "entropy": seed_sequence.entropy,
+                "spawn_key": list(seed_sequence.spawn_key),
+                "pool_size": seed_sequence.pool_size,
+                "n_children_spawned": seed_sequence.n_children_spawned,
+            },
+        }
+
+    def set_state(
+        self,
+        state: dict[str, Any],
+    ) -> None:
+        seed_sequence = state["seed_sequence"]
+        self._seed_sequence = np.random.SeedSequence(
+            seed_sequence["entropy"],
+            spawn_key=tuple(seed_sequence["spawn_key"]),
+            pool_size=seed_sequence["pool_size"],
+            n_children_spawned=seed_sequence["n_children_spawned"],
+        )
+        self.generator = np.random.Generator(np.random.PCG64(self._seed_sequence))
+        self.generator.bit_generator.state = state["bit_generator"]
+        self._buffer = np.asarray(state["buffer"], dtype=np.float64).tolist()
+        self._index = 0
+
+    def random(self) -> float:
+        # Uniform float in [0, 1)
+        if self._index >= len(self._buffer):
+            self._buffer = self.generator.random(self.BUFFER_SIZE).tolist()
+            self._index = 0
+        value = self._buffer[self._index]
+        self._index += 1
+        return value
+
+    def choice(
+        self,
+        seq: Sequence[T],
+    ) -> T:
+        return seq[int(self.random() * len(seq))]
+
+    def integers(
+        self,
+        low: int,
+        high: int,
+        size: Optional[int] = None,
+    ) -> np.ndarray:
+        # Bulk uniform integers in [low, high)
+        return self.generator.integers(low, high, size=size)
+
+    def uniform(
+        self,
+        size: int,
+    ) -> np.ndarray:
+        # Bulk uniform floats in [0, 1)
+        return self.generator.random(size)
+
+    def permutation(
+        self,
+        n: int,
+    ) -> list[int]:
+        return self.generator.permutation(n).tolist()
@@ -0,0 +1,92 @@
+#############################################################################
+# MIT License
+
+# Copyright (c) 2023-2024 Chris Urffer
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#############################################################################
+
+
+import time
+from typing import Optional
+
+import pygame
+
+
+class RenderScheduler:
+
+    # Decides when the renderer draws. Frames are only drawn when there is
+    # something new to show, at most target_fps times a second, and fewer
+    # when drawing can't keep up.
+
+    TARGET_FPS = 30
+
+    # Most frames in a row skipped because drawing is too slow
+    MAX_DROPPED_FRAMES = 4
+
+    def __init__(
+        self,
+        target_fps: int = TARGET_FPS,
+    ) -> None:
+        self._clock = pygame.time.Clock()
+        self._target_fps = target_fps
+        self._frame_budget = 1 / target_fps
+        self._last_version: Optional[int] = None
+        self._frames_to_drop = 0
+        self._draw_start = 0.0
+
+        self.num_drawn = 0
+        self.num_dropped = 0
+
+    def should_draw(
+        self,
+        frame_version: int,
+        needs_redraw: bool,
+    ) -> bool:
+        # Nothing has changed since the last draw
+        if frame_version == self._last_version and not needs_redraw:
+            return False
+
+        # Give the simulation time back after a slow draw. Input still gets
+        # drawn straight away so the window stays responsive.
+        if self._frames_to_drop > 0 and not needs_redraw:
+            self._frames_to_drop -= 1
+            self.num_dropped += 1
+            return False
+
+        self._last_version = frame_version
+        self._draw_start = time.perf_counter()
+        return True
+
+    def drawn(self) -> None:
+        # Call after each draw that should_draw allowed
+        draw_time = time.perf_counter() - self._draw_start
+        self.num_drawn += 1
+        self._frames_to_drop = min(
+            int(draw_time / self._frame_budget),
+            self.MAX_DROPPED_FRAMES,
+        )
+
+    def wait(self) -> None:
+        # Sleep out the rest of this frame's budget
+        self._clock.tick(self._target_fps)
+
+    @property
+    def fps(self) -> float:
+        return self._clock.get_fps()
@@ -0,0 +1,380 @@
+#############################################################################
+# MIT License
+
+# Copyright (c) 2023-2024 Chris Urffer
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#############################################################################
+import numpy as np
+
+
+class NodeGrid:
+
+    # Width in pixels of each grid column. Particles fall straight down, so
+    # bucketing nodes by x column alone narrows a query to nearby nodes.
+    CELL_WIDTH = 32
+
+    # Changed slots are patched in rather than repacking the whole grid:
+    # their old entries are zeroed out in place, and their new entries go to
+    # a small overflow searched alongside the packed grid. Once the overflow
+    # and dead entries together exceed this fraction of the packed entries
+    # (or COMPACT_MIN_ENTRIES), the grid is repacked on the next query.
+    COMPACT_FRACTION = 0.25
+    COMPACT_MIN_ENTRIES = 256
+
+    def __init__(
+        self,
+        cell_width: int = CELL_WIDTH,
+    ) -> None:
+        self._cell_width = cell_width
+
+        # Node circles of each indexed slot, as (xs, ys, radii)
+        self._slots: dict[int, tuple[np.ndarray, np.ndarray, np.ndarray]] = {}
+
+        # Incremented on every change, so callers holding results computed
+        # from the grid can tell when they have gone stale
+        self.version = 0
+
+        # Running total of point/node pairs tested by query and cast
+        self.num_tests = 0
+
+        # Packed grid, rebuilt lazily after clear() or too many patches.
+        # Entries of a slot that was replaced or removed since are dead,
+        # with a squared radius of 0 so they never contain anything.
+        self._dirty = True
+        self._cell_min = 0
+        self._cell_starts = np.zeros(1, dtype=np.int64)
+        self._entry_x = np.zeros(0, dtype=np.int64)
+        self._entry_y = np.zeros(0, dtype=np.int64)
+        self._entry_r2 = np.zeros(0, dtype=np.int64)
+        self._entry_slot = np.zeros(0, dtype=np.int64)
+        self._num_dead = 0
+
+        # Overflow entries of slots changed since the last pack, in the
+        # order they were added, with their absolute cell
+        self._extra_x = np.zeros(0, dtype=np.int64)
+        self._extra_y = np.zeros(0, dtype=np.int64)
+        self._extra_r2 = np.zeros(0, dtype=np.int64)
+        self._extra_slot = np.zeros(0, dtype=np.int64)
+        self._extra_cell = np.zeros(0, dtype=np.int64)
+
+        # Overflow entries sorted by cell, rebuilt lazily
+        self._extra_sorted = True
+        self._extra_order = np.zeros(0, dtype=np.int64)
+        self._extra_sorted_cells = np.zeros(0, dtype=np.int64)
+
+        # Where each slot's entries are, as indices into the packed entries
+        # and the overflow
+        self._slot_entries: dict[int, np.ndarray] = {}
+        self._slot_extra: dict[int, np.ndarray] = {}
+
+    def __contains__(
+        self,
+        slot: int,
+    ) -> bool:
+        return slot in self._slots
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+    def insert(
+        self,
+        slot: int,
+        xs: np.ndarray,
+        ys: np.ndarray,
+        radii: np.ndarray,
+    ) -> None:
+        # Inserting into an occupied slot replaces whatever was there
+        circles = (
+            np.asarray(xs, dtype=np.int64),
+            np.asarray(ys, dtype=np.int64),
+            np.asarray(radii, dtype=np.int64),
+        )
+        self._slots[slot] = circles
+        self.version += 1
+        if not self._dirty:
+            self._kill(slot)
+            self._append(slot, *circles)
+
+    def remove(
+        self,
+        slot: int,
+    ) -> None:
+        if self._slots.pop(slot, None) is not None:
+            self.version += 1
+            if not self._dirty:
+                self._kill(slot)
+
+    def clear(self) -> None:
+        self._slots.clear()
+        self._dirty = True
+        self.version += 1
+
+    def _expand(
+        self,
+        xs: np.ndarray,
+        radii: np.ndarray,
+    ) -> tuple[np.ndarray, np.ndarray]:
+        # A node strictly contains columns (x - r, x + r), so it is entered
+        # into every cell overlapping [x - r + 1, x + r - 1]. Returns the
+        # node and absolute cell of each entry.
+        cell_lo = (xs - radii + 1) // self._cell_width
+        cell_hi = np.maximum((xs + radii - 1) // self._cell_width, cell_lo)
+        spans = cell_hi - cell_lo + 1
+        node_of_entry = np.repeat(np.arange(len(xs)), spans)
+        entry_starts = np.cumsum(spans) - spans
+        cell_of_entry = (
+            cell_lo[node_of_entry] +
+            np.arange(len(node_of_entry)) - entry_starts[node_of_entry]
+        )
+        return node_of_entry, cell_of_entry
+
+    def _pack(self) -> None:
+        self._dirty = False
+        self._num_dead = 0
+        self._slot_extra.clear()
+        empty = np.zeros(0, dtype=np.int64)
+        self._extra_x = self._extra_y = self._extra_r2 = empty
+        self._extra_slot = self._extra_cell = empty
+        self._extra_sorted = True
+        self._extra_order = self._extra_sorted_cells = empty
+
+        if self._slots:
+            xs, ys, radii = (
+                np.concatenate(column)
+                for column in zip(*self._slots.values())
+            )
+            slots = np.concatenate([
+                np.full(len(circles[0]), slot, dtype=np.int64)
+                for slot, circles in self._slots.items()
+            ])
+        else:
+            xs = ys = radii = slots = empty
+
+        if len(xs) == 0:
+            self._cell_min = 0
+            self._cell_starts = np.zeros(1, dtype=np.int64)
+            self._entry_x = self._entry_y = empty
+            self._entry_r2 = self._entry_slot = empty
+            self._slot_entries = {}
+            return
+
+        node_of_entry, cell_of_entry = self._expand(xs, radii)
+        self._cell_min = int(cell_of_entry.min())
+        cell_of_entry -= self._cell_min
+        num_cells = int(cell_of_entry.max()) + 1
+
+        # Sort entries by cell and record where each cell's run starts
+        order = np.argsort(cell_of_entry, kind="stable")
+        node_of_entry = node_of_entry[order]
+        self._cell_starts = np.zeros(num_cells + 1, dtype=np.int64)
+        np.cumsum(
+            np.bincount(cell_of_entry, minlength=num_cells),
+            out=self._cell_starts[1:],
+        )
+        self._entry_x = xs[node_of_entry]
+        self._entry_y = ys[node_of_entry]
+        self._entry_r2 = radii[node_of_entry] ** 2
+        self._entry_slot = slots[node_of_entry]
+
+        # Group entry indices by slot, so a changed slot can be killed
+        by_slot = np.argsort(self._entry_slot, kind="stable")
+        slot_ids, slot_starts = np.unique(self._entry_slot[by_slot], return_index=True)
+        self._slot_entries = dict(zip(
+            slot_ids.tolist(),
+            np.split(by_slot, slot_starts[1:]),
+        ))
+
+    def _kill(
+        self,
+        slot: int,
+    ) -> None:
+        # Make a slot's existing entries dead
+        entries = self._slot_entries.pop(slot, None)
+        if entries is not None:
+            self._entry_r2[entries] = 0
+            self._num_dead += len(entries)
+        extra = self._slot_extra.pop(slot, None)
+        if extra is not None:
+            self._extra_r2[extra] = 0
+            self._num_dead += len(extra)
+
+    def _append(
+        self,
+        slot: int,
+        xs: np.ndarray,
+        ys: np.ndarray,
+        radii: np.ndarray,
+    ) -> None:
+        # Add a slot's entries to the overflow, or schedule a repack if the
+        # overflow has grown too large
+        node_of_entry, cell_of_entry = self._expand(xs, radii)
+        num_extra = len(self._extra_x)
+        if (
+            num_extra + len(node_of_entry) + self._num_dead >
+            max(self.COMPACT_FRACTION * len(self._entry_x), self.COMPACT_MIN_ENTRIES)
+        ):
+            self._dirty = True
+            return
+
+        self._extra_x = np.concatenate([self._extra_x, xs[node_of_entry]])
+        self._extra_y = np.concatenate([self._extra_y, ys[node_of_entry]])
+        self._extra_r2 = np.concatenate([self._extra_r2, radii[node_of_entry] ** 2])
+        self._extra_slot = np.concatenate([
+            self._extra_slot,
+            np.full(len(node_of_entry), slot, dtype=np.int64),
+        ])
+        self._extra_cell = np.concatenate([self._extra_cell, cell_of_entry])
+        self._slot_extra[slot] = np.arange(num_extra, len(self._extra_x))
+        self._extra_sorted = False
+
+    @staticmethod
+    def _pair_runs(
+        starts: np.ndarray,
+        counts: np.ndarray,
+    ) -> tuple[np.ndarray, np.ndarray]:
+        # Pair every point with each position in its run [start, start +
+        # count). Returns the point index and position of each pair.
+        point_of_pair = np.repeat(np.arange(len(starts)), counts)
+        pair_starts = np.cumsum(counts) - counts
+        position_of_pair = (
+            starts[point_of_pair] +
+            np.arange(len(point_of_pair)) - pair_starts[point_of_pair]
+        )
+        return point_of_pair, position_of_pair
+
+    def _candidates(
+        self,
+        xs: np.ndarray,
+    ) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        # Pair every point with every entry in its grid column. Returns the
+        # point index of each candidate pair, and the x, y, squared radius
+        # and slot of its entry.
+        if self._dirty:
+            self._pack()
+
+        cells = xs // self._cell_width
+        empty = np.zeros(0, dtype=np.int64)
+        point_of_pair = entry_x = entry_y = entry_r2 = entry_slot = empty
+
+        num_cells = len(self._cell_starts) - 1
+        if num_cells > 0:
+            packed_cells = cells - self._cell_min
+            in_grid = (packed_cells >= 0) & (packed_cells < num_cells)
+            packed_cells = np.where(in_grid, packed_cells, 0)
+            starts = self._cell_starts[packed_cells]
+            counts = np.where(in_grid, self._cell_starts[packed_cells + 1] - starts, 0)
+            point_of_pair, entry_of_pair = self._pair_runs(starts, counts)
+            entry_x = self._entry_x[entry_of_pair]
+            entry_y = self._entry_y[entry_of_pair]
+            entry_r2 = self._entry_r2[entry_of_pair]
+            entry_slot = self._entry_slot[entry_of_pair]
+
+        if len(self._extra_x) > 0:
+            if not self._extra_sorted:
+                self._extra_order = np.argsort(self._extra_cell, kind="stable")
+                self._extra_sorted_cells = self._extra_cell[self._extra_order]
+                self._extra_sorted = True
+            starts = np.searchsorted(self._extra_sorted_cells, cells, side="left")
+            counts = np.searchsorted(self._extra_sorted_cells, cells, side="right") - starts
+            extra_point, extra_position = self._pair_runs(starts, counts)
+            extra_of_pair = self._extra_order[extra_position]
+            point_of_pair = np.concatenate([point_of_pair, extra_point])
+            entry_x = np.concatenate([entry_x, self._extra_x[extra_of_pair]])
+            entry_y = np.concatenate([entry_y, self._extra_y[extra_of_pair]])
+            entry_r2 = np.concatenate([entry_r2, self._extra_r2[extra_of_pair]])
+            entry_slot = np.concatenate([entry_slot, self._extra_slot[extra_of_pair]])
+
+        self.num_tests += len(point_of_pair)
+        return point_of_pair, entry_x, entry_y, entry_r2, entry_slot
+
+    def query(
+        self,
+        xs: np.ndarray,
+        ys: np.ndarray,
+    ) -> np.ndarray:
+        # For each point, the lowest slot with a node strictly containing the
+        # point, or -1 if no node contains it
+        ret = np.full(len(xs), -1, dtype=np.int64)
+        if len(xs) == 0:
+            return ret
+
+        point_of_pair, entry_x, entry_y, entry_r2, entry_slot = self._candidates(xs)
+        dx = xs[point_of_pair] - entry_x
+        dy = ys[point_of_pair] - entry_y
+        hits = dx*dx + dy*dy < entry_r2
+
+        no_hit = np.iinfo(np.int64).max
+        lowest = np.full(len(xs), no_hit, dtype=np.int64)
+        np.minimum.at(
+            lowest,
+            point_of_pair[hits],
+            entry_slot[hits],
+        )
+        ret[lowest != no_hit] = lowest[lowest != no_hit]
+        return ret
+
+    def cast(
+        self,
+        xs: np.ndarray,
+        ys_from: np.ndarray,
+    ) -> tuple[np.ndarray, np.ndarray]:
+        # Cast a ray straight down from each point. Returns, for each point,
+        # the first y >= ys_from at which a node strictly contains the point
+        # and the lowest slot containing it there, or (-1, -1) if the ray
+        # never hits a node.
+        hit_ys = np.full(len(xs), -1, dtype=np.int64)
+        hit_slots = np.full(len(xs), -1, dtype=np.int64)
+        if len(xs) == 0:
+            return hit_ys, hit_slots
+
+        point_of_pair, entry_x, entry_y, entry_r2, entry_slot = self._candidates(xs)
+        dx = xs[point_of_pair] - entry_x
+        span2 = entry_r2 - dx*dx
+
+        # A node covers the integer ys with dy*dy < span2, i.e. |dy| <= k for
+        # the largest integer k with k*k <= span2 - 1
+        crossed = span2 > 0
+        point_of_pair = point_of_pair[crossed]
+        span2_less_one = span2[crossed] - 1
+        k = np.floor(np.sqrt(span2_less_one)).astype(np.int64)
+        k += (k + 1)**2 <= span2_less_one
+        k -= k**2 > span2_less_one
+
+        cy = entry_y[crossed]
+        slots = entry_slot[crossed]
+        y_from = ys_from[point_of_pair]
+        reached = cy + k >= y_from
+        enter_ys = np.maximum(cy - k, y_from)[reached]
+        point_of_pair = point_of_pair[reached]
+        slots = slots[reached]
+
+        # Pick the earliest hit, breaking ties by the lowest slot
+        slot_bits = 32
+        no_hit = np.iinfo(np.int64).max
+        earliest = np.full(len(xs), no_hit, dtype=np.int64)
+        np.minimum.at(
+            earliest,
+            point_of_pair,
+            (enter_ys << slot_bits) | slots,
+        )
+        hit = earliest != no_hit
+        hit_ys[hit] = earliest[hit] >> slot_bits
+        hit_slots[hit] = earliest[hit] & ((1 << slot_bits) - 1)
+        return hit_ys, hit_slots
@@ -23,23 +23,40 @@
 #############################################################################
 
 
+from enum import Enum
+from typing import Optional
+
 from pytrees.interfaces import Tickable
-from pytrees.environment import Environment
+from pytrees.environment import CollisionMode, Environment
+from pytrees.rng import Seed
+
+
+class PyTreesEvent(Enum):
+    TOGGLE_TICK = "p"
+    TOGGLE_PROFILE = "f"
+    TOGGLE_FAST_FORWARD = "t"
 
 
 class PyTreesState(Tickable):
 
+    # Where a profile is written when profiling is toggled off
+    PROFILE_PATH = "pytrees.prof"
+
     def __init__(
         self,
+        collision_mode: CollisionMode = CollisionMode.STEPPED,
+        seed: Seed = None,
+        environment: Optional[Environment] = None,
     ) -> None:
-        self.environment: Environment = Environment()
+        # Start a new simulation unless one is given, e.g. from a checkpoint
+        self.environment: Environment = environment or Environment(
+            collision_mode=collision_mode,
+            seed=seed,
+        )
         self.ticking = True
 
-    def draw(
-        self,
-        disp: "PyTreesDisplay"
-    ) -> None:
-        self.environment.draw(disp)
+        # Tick without publishing frames to the renderer
+        self.fast_forward = False
 
     def tick(
         self,
@@ -49,9 +66,16 @@ class PyTreesState(Tickable):
 
     def process_event(
         self,
-        event: "PyTreesEvent",
+        event: PyTreesEvent,
     ) -> None:
         if event == PyTreesEvent.TOGGLE_TICK:
             self.ticking = not self.ticking
-
-from pytrees.display import PyTreesDisplay, PyTreesEvent
+        elif event == PyTreesEvent.TOGGLE_FAST_FORWARD:
+            self.fast_forward = not self.fast_forward
+        elif event == PyTreesEvent.TOGGLE_PROFILE:
+            stats = self.environment.stats
+            if stats.profiling:
+                stats.stop_profiling(self.PROFILE_PATH)
+                print(f"Wrote profile to {self.PROFILE_PATH}")
+            else:
+                stats.start_profiling()
@@ -0,0 +1,380 @@
+#############################################################################
+# MIT License
+
+# Copyright (c) 2023-2024 Chris Urffer
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#############################################################################
+
+
+# Parameter sweeps over independent headless environments. Each point of a
+# sweep is a SweepConfig; points run in parallel across a process pool and
+# their summary metrics are collected into one table.
+#
+#   python -m pytrees.sweep --grid mutation.CHANCE_NODE_ADD=0.1,0.3,0.5 \
+#       --grid env.WIDTH=1500,3000 --seeds 4 --output results.csv
+
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import ExitStack
+import csv
+import itertools
+import os
+import sys
+import time
+from typing import Any, Optional
+
+import numpy as np
+
+from pytrees.environment import CollisionMode, Environment
+from pytrees.mutation import MutationConfig
+from pytrees.warmup import WarmupCache
+
+
+# Columns run_config reports, after the parameters. Runs that raise get an
+# error column instead.
+METRICS = (
+    "total_energy",
+    "mean_energy",
+    "best_energy",
+    "mean_nodes",
+    "max_nodes",
+    "live_particles",
+    "build_sec",
+    "ticks_per_sec",
+)
+
+
+class SweepConfig:
+
+    # Everything that defines one run. Parameter names are namespaced:
+    # "env.<Environment attribute>", "mutation.<MutationConfig name>",
+    # "ticks", "seed" and "collision_mode".
+
+    NUM_TICKS = 2000
+
+    def __init__(
+        self,
+        environment: Optional[dict[str, Any]] = None,
+        mutation: Optional[dict[str, float]] = None,
+        num_ticks: int = NUM_TICKS,
+        seed: int = 0,
+        collision_mode: CollisionMode = CollisionMode.ANALYTIC,
+    ) -> None:
+        self.environment = dict(environment or {})
+        self.mutation = dict(mutation or {})
+        self.num_ticks = num_ticks
+        self.seed = seed
+        self.collision_mode = collision_mode
+        # Fail on a misspelt parameter here rather than in a worker
+        Environment.check_params(self.environment)
+        MutationConfig(**self.mutation)
+
+    @classmethod
+    def from_params(
+        cls,
+        params: dict[str, Any],
+    ) -> "SweepConfig":
+        kwargs: dict[str, Any] = {"environment": {}, "mutation": {}}
+        for name, value in params.items():
+            if name.startswith("env."):
+                kwargs["environment"][name[len("env."):]] = value
+            elif name.startswith("mutation."):
+                kwargs["mutation"][name[len("mutation."):]] = value
+            elif name == "ticks":
+                kwargs["num_ticks"] = int(value)
+            elif name == "seed":
+                kwargs["seed"] = int(value)
+            elif name == "collision_mode":
+                kwargs["collision_mode"] = CollisionMode(value)
+            else:
+                raise ValueError(f"unknown sweep parameter: {name}")
+        return cls(**kwargs)
+
+    def params(self) -> dict[str, Any]:
+        return {
+            **{f"env.{name}": value for name, value in self.environment.items()},
+            **{f"mutation.{name}": value for name, value in self.mutation.items()},
+            "ticks": self.num_ticks,
+            "seed": self.seed,
+            "collision_mode": self.collision_mode.value,
+        }
+
+    def cost(self) -> float:
+        # Rough relative run time, used to start the longest runs first.
+        # Values that are not numbers cost nothing here; the run itself
+        # fails and is reported.
+        def param(name: str) -> float:
+            return float(self.environment.get(name, getattr(Environment, name)))
+        try:
+            return (
+                (param("NUM_WARMUP_TICKS") + self.num_ticks) *
+                param("WIDTH") * param("NUM_PARTICLES_PER_TICK")
+            )
+        except (TypeError, ValueError):
+            return 0.0
+
+    def build(self) -> Environment:
+        return Environment.with_params(
+            self.environment,
+            collision_mode=self.collision_mode,
+            seed=self.seed,
+            mutation=MutationConfig(**self.mutation),
+        )
+
+
+def run_config(
+    config: SweepConfig,
+) -> dict[str, Any]:
+    # Run one sweep point and summarise it. Runs in a worker process.
+    time_start = time.perf_counter()
+    environment = config.build()
+    time_built = time.perf_counter()
+    for _ in range(config.num_ticks):
+        environment.tick()
+    time_end = time.perf_counter()
+
+    energies = np.array([tree._energy for tree in environment._trees], dtype=np.int64)
+    node_counts = np.array([len(tree._nodes) for tree in environment._trees], dtype=np.int64)
+    return {
+        "total_energy": int(energies.sum()),
+        "mean_energy": float(energies.mean()) if len(energies) else 0.0,
+        "best_energy": int(energies.max()) if len(energies) else 0,
+        "mean_nodes": float(node_counts.mean()) if len(node_counts) else 0.0,
+        "max_nodes": int(node_counts.max()) if len(node_counts) else 0,
+        "live_particles": len(environment.particles),
+        "build_sec": time_built - time_start,
+        "ticks_per_sec": config.num_ticks / (time_end - time_built) if time_end > time_built else 0.0,
+    }
+
+
+def grid(
+    axes: dict[str, list[Any]],
+    base: Optional[dict[str, Any]] = None,
+) -> list[SweepConfig]:
+    # Every combination of the axis values, on top of the base parameters
+    names = list(axes)
+    return [
+        SweepConfig.from_params({**(base or {}), **dict(zip(names, values))})
+        for values in itertools.product(*(axes[name] for name in names))
+    ]
+
+
+def random_sample(
+    ranges: dict[str, tuple[float, float]],
+    num_samples: int,
+    seed: int = 0,
+    base: Optional[dict[str, Any]] = None,
+) -> list[SweepConfig]:
+    # Uniform samples from each range. Ranges with integer bounds give
+    # integers, inclusive of both ends.
+    rng = np.random.default_rng(seed)
+    configs: list[SweepConfig] = []
+    for _ in range(num_samples):
+        params = dict(base or {})
+        for name, (low, high) in ranges.items():
+            if isinstance(low, int) and isinstance(high, int):
+                params[name] = int(rng.integers(low, high + 1))
+            else:
+                params[name] = float(rng.uniform(low, high))
+        configs.append(SweepConfig.from_params(params))
+    return configs
+
+
+def _init_worker(
+    warmup_cache_path: Optional[str],
+) -> None:
+    # Runs that differ only in tree or mutation parameters share a warmup
+    Environment.warmup_cache = WarmupCache(warmup_cache_path)
+
+
+def run_sweep(
+    configs: list[SweepConfig],
+    max_workers: Optional[int] = None,
+    verbose: bool = True,
+    warmup_cache_path: Optional[str] = None,
+    output: Optional[str] = None,
+) -> list[dict[str, Any]]:
+    # Returns one row of parameters and metrics per config, in config order.
+    # Runs are submitted longest first. Idle workers take the next pending
+    # run from the pool's shared queue, so short runs fill in around long
+    # ones instead of a fixed split leaving workers idle. Each worker caches
+    # warmups in memory, and in warmup_cache_path if given.
+    # A run that raises gets an error column instead of metrics, and the
+    # sweep carries on. With output set, rows are also appended to that CSV
+    # as they complete, so an interrupted sweep keeps the finished runs.
+    rows: list[Optional[dict[str, Any]]] = [None] * len(configs)
+    order = sorted(range(len(configs)), key=lambda i: configs[i].cost(), reverse=True)
+    with ExitStack() as stack:
+        writer = None
+        if output is not None:
+            f = stack.enter_context(open(output, "w", newline=""))
+            writer = csv.DictWriter(f, _columns([config.params() for config in configs]))
+            writer.writeheader()
+        executor = stack.enter_context(ProcessPoolExecutor(
+            max_workers=max_workers or os.cpu_count(),
+            initializer=_init_worker,
+            initargs=(warmup_cache_path,),
+        ))
+        futures = {executor.submit(run_config, configs[i]): i for i in order}
+        for num_done, future in enumerate(as_completed(futures), start=1):
+            i = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                result = {"error": f"{type(e).__name__}: {e}"}
+            rows[i] = {**configs[i].params(), **result}
+            if writer is not None:
+                writer.writerow(rows[i])
+                f.flush()
+            if verbose:
+                print(f"[{num_done}/{len(configs)}] {rows[i]}", file=sys.stderr)
+    return [row for row in rows if row is not None]
+
+
+def _columns(
+    rows: list[dict[str, Any]],
+) -> list[str]:
+    # Parameter columns in first-seen order, then every metric
+    columns: list[str] = []
+    for row in rows:
+        columns += [
+            column for column in row
+            if column not in columns and column not in METRICS and column != "error"
+        ]
+    return columns + list(METRICS) + ["error"]
+
+
+def write_table(
+    rows: list[dict[str, Any]],
+    path: str,
+) -> None:
+    columns = _columns(rows)
+    with open(path, "w", newline="") as f:
+        writer = csv.DictWriter(f, columns)
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def _parse_value(
+    text: str,
+) -> Any:
+    for parse in (int, float):
+        try:
+            return parse(text)
+        except ValueError:
+            pass
+    return text
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Sweep PyTrees parameters across processes")
+    parser.add_argument(
+        "--grid",
+        action="append",
+        default=[],
+        metavar="NAME=V1,V2,...",
+        help="axis of a grid sweep, e.g. mutation.CHANCE_NODE_ADD=0.1,0.3",
+    )
+    parser.add_argument(
+        "--range",
+        action="append",
+        default=[],
+        metavar="NAME=LOW:HIGH",
+        help="range to sample for a random sweep, e.g. env.WIDTH=1500:6000",
+    )
+    parser.add_argument(
+        "--samples",
+        type=int,
+        default=0,
+        help="number of random samples from --range (default: grid sweep)",
+    )
+    parser.add_argument(
+        "--set",
+        action="append",
+        default=[],
+        metavar="NAME=VALUE",
+        help="parameter fixed for every run",
+    )
+    parser.add_argument("--ticks", type=int, default=SweepConfig.NUM_TICKS)
+    parser.add_argument(
+        "--seeds",
+        type=int,
+        default=1,
+        help="independent runs of every config, seeded 0 to SEEDS-1",
+    )
+    parser.add_argument(
+        "--collision-mode",
+        choices=[mode.value for mode in CollisionMode],
+        default=CollisionMode.ANALYTIC.value,
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="worker processes (default: one per core)",
+    )
+    parser.add_argument("--output", default="sweep.csv", help="CSV file to write results to")
+    parser.add_argument(
+        "--warmup-cache",
+        default=None,
+        help="directory to share warmed-up particle fields through, across workers and runs",
+    )
+    args = parser.parse_args()
+
+    base: dict[str, Any] = {"ticks": args.ticks, "collision_mode": args.collision_mode}
+    for item in args.set:
+        name, value = item.split("=", 1)
+        base[name] = _parse_value(value)
+
+    if args.samples > 0:
+        ranges = {}
+        for item in args.range:
+            name, bounds = item.split("=", 1)
+            low, high = bounds.split(":", 1)
+            ranges[name] = (_parse_value(low), _parse_value(high))
+        points = random_sample(ranges, args.samples, base=base)
+    else:
+        axes = {}
+        for item in args.grid:
+            name, values = item.split("=", 1)
+            axes[name] = [_parse_value(value) for value in values.split(",")]
+        points = grid(axes, base)
+
+    # Replicate every point across seeds
+    configs = [
+        SweepConfig.from_params({**point.params(), "seed": seed})
+        for point in points
+        for seed in range(args.seeds)
+    ]
+
+    rows = run_sweep(
+        configs,
+        args.workers,
+        warmup_cache_path=args.warmup_cache,
+        output=args.output,
+    )
+    # Rewrite in config order now that every run is in
+    write_table(rows, args.output)
+    num_failed = sum(1 for row in rows if "error" in row)
+    print(f"Wrote {len(rows)} runs to {args.output} ({num_failed} failed)", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,329 @@
+#############################################################################
+# MIT License
+
+# Copyright (c) 2023-2024 Chris Urffer
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#############################################################################
+
+
+# Streaming telemetry for offline analysis. Records are buffered per table in
+# fixed-size numpy chunks and written by a background thread as one .npy file
+# per column per chunk:
+#
+#   <directory>/<table>/<chunk>.<column>.npy
+#
+# Tables:
+#   ticks        one row per sampled tick: population totals and node counts
+#                by type
+#   trees        one row per tree per sampled tick
+#   absorptions  one row per particle absorbed on a sampled tick
+#   generations  one row per Evolution generation
+
+import os
+import queue
+import threading
+import time
+from typing import TYPE_CHECKING, Optional
+import weakref
+
+import numpy as np
+
+from pytrees.tree import NODE_TYPES, NODE_TYPE_CODES, Tree
+
+if TYPE_CHECKING:
+    from pytrees.environment import Environment
+    from pytrees.evolution import GenerationResult
+
+
+TABLES: dict[str, dict[str, type]] = {
+    "ticks": {
+        "tick": np.int64,
+        "num_trees": np.int64,
+        "total_energy": np.int64,
+        "live_particles": np.int64,
+        "absorptions": np.int64,
+        **{f"nodes_{type.name.lower()}": np.int64 for type in NODE_TYPES},
+    },
+    "trees": {
+        "tick": np.int64,
+        "tree": np.int64,
+        "energy": np.int64,
+        "num_nodes": np.int64,
+    },
+    "absorptions": {
+        "tick": np.int64,
+        "tree": np.int64,
+        "power": np.int64,
+    },
+    "generations": {
+        "generation": np.int64,
+        "best_energy": np.int64,
+        "mean_energy": np.float64,
+        "mean_nodes": np.float64,
+        "mean_age": np.float64,
+        "max_age": np.int64,
+        "duration": np.float64,
+    },
+}
+
+
+class _TableBuffer:
+
+    # Fixed-size column buffers for one table. Full chunks are handed to
+    # the writer's queue.
+
+    def __init__(
+        self,
+        name: str,
+        chunk_rows: int,
+    ) -> None:
+        self.name = name
+        self.num_chunks = 0
+        self._chunk_rows = chunk_rows
+        self._columns = {
+            column: np.zeros(chunk_rows, dtype=dtype)
+            for column, dtype in TABLES[name].items()
+        }
+        self._size = 0
+
+    def append(
+        self,
+        writer: "TelemetryWriter",
+        **values: np.ndarray,
+    ) -> None:
+        # Append rows given as equal-length arrays (or scalars) per column.
+        # Scalars are repeated for every row; with no arrays, they make up
+        # a single row.
+        lengths = [len(value) for value in values.values() if np.ndim(value)]
+        num_rows = min(lengths) if lengths else 1
+        start = 0
+        while start < num_rows:
+            count = min(num_rows - start, self._chunk_rows - self._size)
+            for column, buffer in self._columns.items():
+                value = values[column]
+                buffer[self._size:self._size + count] = (
+                    value[start:start + count] if np.ndim(value) else value
+                )
+            self._size += count
+            start += count
+            if self._size == self._chunk_rows:
+                self.flush(writer)
+
+    def flush(
+        self,
+        writer: "TelemetryWriter",
+    ) -> None:
+        if self._size == 0:
+            return
+        chunk = {column: buffer[:self._size].copy() for column, buffer in self._columns.items()}
+        writer._submit(self.name, self.num_chunks, chunk)
+        self.num_chunks += 1
+        self._size = 0
+
+
+class TelemetryWriter:
+
+    # Collects telemetry from Environment.tick (and optionally Evolution)
+    # into per-table chunks. Writes happen on a background thread; if it
+    # falls more than max_pending_chunks behind, new chunks are dropped and
+    # counted rather than blocking the simulation. Partly filled chunks are
+    # also written every flush_interval seconds, so slow tables reach disk
+    # during a long run rather than only at close.
+
+    CHUNK_ROWS = 65536
+    MAX_PENDING_CHUNKS = 16
+    FLUSH_INTERVAL = 10.0
+
+    def __init__(
+        self,
+        directory: str,
+        sample_interval: int = 1,
+        chunk_rows: int = CHUNK_ROWS,
+        max_pending_chunks: int = MAX_PENDING_CHUNKS,
+        flush_interval: float = FLUSH_INTERVAL,
+    ) -> None:
+        self._directory = directory
+        self._sample_interval = sample_interval
+        self._flush_interval = flush_interval
+        self._last_flush = time.monotonic()
+        for table in TABLES:
+            os.makedirs(os.path.join(directory, table), exist_ok=True)
+
+        self._tables = {table: _TableBuffer(table, chunk_rows) for table in TABLES}
+        self.num_dropped_chunks = 0
+
+        # Node counts by type of each tree, as of the tree version counted
+        self._node_counts: weakref.WeakKeyDictionary[Tree, tuple[int, np.ndarray]] = (
+            weakref.WeakKeyDictionary()
+        )
+
+        self._queue: queue.Queue[Optional[tuple[str, int, dict[str, np.ndarray]]]] = (
+            queue.Queue(max_pending_chunks)
+        )
+        self._thread = threading.Thread(target=self._write_chunks, daemon=True)
+        self._thread.start()
+
+    def sampled(
+        self,
+        tick: int,
+    ) -> bool:
+        return tick % self._sample_interval == 0
+
+    def record_tick(
+        self,
+        environment: "Environment",
+        num_absorptions: int,
+    ) -> None:
+        # Called at the end of each tick, before the tick counter advances
+        tick = environment._num_ticks
+        if not self.sampled(tick):
+            return
+
+        trees = environment._trees
+        energies = np.fromiter((tree._energy for tree in trees), np.int64, len(trees))
+        node_counts = (
+            np.array([self._count_nodes(tree) for tree in trees])
+            if trees else np.zeros((0, len(NODE_TYPES)), dtype=np.int64)
+        )
+        type_totals = node_counts.sum(axis=0)
+
+        self._tables["ticks"].append(
+            self,
+            tick=tick,
+            num_trees=len(trees),
+            total_energy=energies.sum(),
+            live_particles=len(environment._particles),
+            absorptions=num_absorptions,
+            **{
+                f"nodes_{type.name.lower()}": type_totals[code]
+                for type, code in NODE_TYPE_CODES.items()
+            },
+        )
+        self._tables["trees"].append(
+            self,
+            tick=tick,
+            tree=np.arange(len(trees)),
+            energy=energies,
+            num_nodes=node_counts.sum(axis=1),
+        )
+        self._maybe_flush()
+
+    def record_absorptions(
+        self,
+        tick: int,
+        trees: np.ndarray,
+        powers: np.ndarray,
+    ) -> None:
+        if not self.sampled(tick) or len(trees) == 0:
+            return
+        self._tables["absorptions"].append(self, tick=tick, tree=trees, power=powers)
+
+    def record_generation(
+        self,
+        result: "GenerationResult",
+    ) -> None:
+        self._tables["generations"].append(
+            self,
+            generation=result.generation,
+            best_energy=result.best_energy,
+            mean_energy=result.mean_energy,
+            mean_nodes=sum(result.node_counts) / len(result.node_counts),
+            mean_age=result.mean_age,
+            max_age=max(result.ages),
+            duration=result.duration,
+        )
+        self._maybe_flush()
+
+    def _count_nodes(
+        self,
+        tree: Tree,
+    ) -> np.ndarray:
+        cached = self._node_counts.get(tree)
+        if cached is None or cached[0] != tree._version:
+            counts = np.zeros(len(NODE_TYPES), dtype=np.int64)
+            for node in tree._nodes:
+                counts[NODE_TYPE_CODES[node._type]] += 1
+            cached = (tree._version, counts)
+            self._node_counts[tree] = cached
+        return cached[1]
+
+    def _maybe_flush(self) -> None:
+        if time.monotonic() - self._last_flush >= self._flush_interval:
+            self.flush()
+
+    def flush(self) -> None:
+        # Hand partly filled chunks to the writer thread
+        for table in self._tables.values():
+            table.flush(self)
+        self._last_flush = time.monotonic()
+
+    def close(self) -> None:
+        self.flush()
+        self._queue.put(None)
+        self._thread.join()
+
+    def _submit(
+        self,
+        table: str,
+        index: int,
+        chunk: dict[str, np.ndarray],
+    ) -> None:
+        try:
+            self._queue.put_nowait((table, index, chunk))
+        except queue.Full:
+            self.num_dropped_chunks += 1
+
+    def _write_chunks(self) -> None:
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            table, index, chunk = item
+            for column, values in chunk.items():
+                path = os.path.join(self._directory, table, f"{index:06d}.{column}.npy")
+                np.save(f"{path}.tmp.npy", values)
+                os.replace(f"{path}.tmp.npy", path)
+
+
+def read_table(
+    directory: str,
+    table: str,
+) -> dict[str, np.ndarray]:
+    # Concatenate every complete chunk of a table. Chunks still being written
+    # are skipped.
+    columns = list(TABLES[table])
+    table_dir = os.path.join(directory, table)
+    files = set(os.listdir(table_dir)) if os.path.isdir(table_dir) else set()
+    chunks = sorted(
+        name.split(".")[0]
+        for name in files
+        if name.endswith(f".{columns[0]}.npy")
+    )
+    chunks = [
+        chunk for chunk in chunks
+        if all(f"{chunk}.{column}.npy" in files for column in columns)
+    ]
+    return {
+        column: np.concatenate(
+            [np.load(os.path.join(table_dir, f"{chunk}.{column}.npy")) for chunk in chunks]
+            or [np.zeros(0, dtype=TABLES[table][column])]
+        )
+        for column in columns
+    }
@@ -0,0 +1,527 @@
+#############################################################################
+# MIT License
+
+# Copyright (c) 2023-2024 Chris Urffer
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#############################################################################
+
+
+import multiprocessing
+from multiprocessing import resource_tracker, shared_memory
+import queue
+import time
+from typing import Optional
+import weakref
+
+import numpy as np
+
+from pytrees.environment import Environment, Landscape
+from pytrees.tree import NODE_TYPE_CODES, Tree
+from pytrees.utils import Dims
+
+
+# Names of shared memory segments created by publishers in this process
+_owned_segments: set[str] = set()
+
+
+class RenderStatic:
+
+    # Data that rarely changes, sent to the renderer once instead of being
+    # packed into every frame
+
+    def __init__(
+        self,
+        dims: Dims,
+        ground_levels: np.ndarray,
+    ) -> None:
+        self.dims = dims
+        self.ground_levels = ground_levels
+
+
+class RenderFrame:
+
+    # Column layout of each per-frame array
+    TREE_KEY = 0
+    TREE_ENERGY = 1
+    TREE_LEFT = 2
+    TREE_TOP = 3
+    TREE_RIGHT = 4
+    TREE_BOTTOM = 5
+    TREE_NODE_START = 6
+    TREE_NODE_COUNT = 7
+    TREE_VERSION = 8
+    NUM_TREE_COLUMNS = 9
+
+    NODE_X = 0
+    NODE_Y = 1
+    NODE_SIZE = 2
+    NODE_TYPE = 3
+    NODE_PARENT = 4
+    NUM_NODE_COLUMNS = 5
+
+    PARTICLE_X = 0
+    PARTICLE_Y = 1
+    PARTICLE_TYPE = 2
+    PARTICLE_POWER = 3
+    NUM_PARTICLE_COLUMNS = 4
+
+    # Simulation stats carried in the frame header, for the debug overlay
+    STATS = (
+        "tick_us",
+        "publish_us",
+        "ticks_per_sec",
+        "live_particles",
+        "collision_tests",
+        "hits",
+    )
+
+    def __init__(
+        self,
+        version: int,
+        tick: int,
+        trees: np.ndarray,
+        nodes: np.ndarray,
+        particles: np.ndarray,
+        stats: Optional[dict[str, int]] = None,
+    ) -> None:
+        self.version = version
+        self.tick = tick
+        self.stats = stats if stats is not None else {}
+
+        # One row per tree. Trees keep a stable key for as long as they live,
+        # and their version changes whenever their shape does.
+        self.trees = trees
+
+        # One row per node, grouped by tree in pre-order. Parents are global
+        # row indices, or -1 for a root node.
+        self.nodes = nodes
+
+        # One row per live particle
+        self.particles = particles
+
+    def tree_nodes(
+        self,
+        index: int,
+    ) -> np.ndarray:
+        start = self.trees[index, self.TREE_NODE_START]
+        count = self.trees[index, self.TREE_NODE_COUNT]
+        return self.nodes[start:start + count]
+
+    def tree_index(
+        self,
+        key: int,
+    ) -> Optional[int]:
+        matches = np.flatnonzero(self.trees[:, self.TREE_KEY] == key)
+        return int(matches[0]) if len(matches) else None
+
+
+class _FrameBuffer:
+
+    # Numpy views laid out over a shared memory segment
+
+    HEADER_SEQ = 0
+    HEADER_VERSION = 1
+    HEADER_TICK = 2
+    HEADER_NUM_TREES = 3
+    HEADER_NUM_NODES = 4
+    HEADER_NUM_PARTICLES = 5
+    HEADER_CAPACITY_TREES = 6
+    HEADER_CAPACITY_NODES = 7
+    HEADER_CAPACITY_PARTICLES = 8
+    HEADER_STATS = 9
+    # Sequence number of the last frame the reader copied out
+    HEADER_READ_SEQ = 15
+    HEADER_SIZE = 16
+
+    def __init__(
+        self,
+        segment: shared_memory.SharedMemory,
+        capacities: Optional[tuple[int, int, int]] = None,
+    ) -> None:
+        self.segment = segment
+        self.header = np.ndarray(
+            (self.HEADER_SIZE,),
+            dtype=np.int64,
+            buffer=segment.buf,
+        )
+        if capacities is not None:
+            self.header[self.HEADER_CAPACITY_TREES] = capacities[0]
+            self.header[self.HEADER_CAPACITY_NODES] = capacities[1]
+            self.header[self.HEADER_CAPACITY_PARTICLES] = capacities[2]
+
+        offset = self.HEADER_SIZE * 8
+        self.trees, offset = self._view(
+            offset, self.header[self.HEADER_CAPACITY_TREES],
+            RenderFrame.NUM_TREE_COLUMNS,
+        )
+        self.nodes, offset = self._view(
+            offset, self.header[self.HEADER_CAPACITY_NODES],
+            RenderFrame.NUM_NODE_COLUMNS,
+        )
+        self.particles, offset = self._view(
+            offset, self.header[self.HEADER_CAPACITY_PARTICLES],
+            RenderFrame.NUM_PARTICLE_COLUMNS,
+        )
+
+    def _view(
+        self,
+        offset: int,
+        rows: int,
+        columns: int,
+    ) -> tuple[np.ndarray, int]:
+        view = np.ndarray(
+            (int(rows), columns),
+            dtype=np.int64,
+            buffer=self.segment.buf,
+            offset=offset,
+        )
+        return view, offset + view.nbytes
+
+    @classmethod
+    def size_for(
+        cls,
+        capacities: tuple[int, int, int],
+    ) -> int:
+        return 8 * (
+            cls.HEADER_SIZE +
+            capacities[0] * RenderFrame.NUM_TREE_COLUMNS +
+            capacities[1] * RenderFrame.NUM_NODE_COLUMNS +
+            capacities[2] * RenderFrame.NUM_PARTICLE_COLUMNS
+        )
+
+    def capacities(self) -> tuple[int, int, int]:
+        return (
+            int(self.header[self.HEADER_CAPACITY_TREES]),
+            int(self.header[self.HEADER_CAPACITY_NODES]),
+            int(self.header[self.HEADER_CAPACITY_PARTICLES]),
+        )
+
+    def release(self) -> None:
+        # Views must be dropped before the segment can be closed
+        del self.header, self.trees, self.nodes, self.particles
+        self.segment.close()
+
+
+class FramePublisher:
+
+    # Simulation side of the render channel. Static data and the names of
+    # new shared memory segments go over a control queue; frames are written
+    # into shared memory under a seqlock, so they never get pickled.
+
+    def __init__(
+        self,
+        control_queue: "multiprocessing.Queue[tuple]",
+        max_fps: Optional[float] = None,
+    ) -> None:
+        self._control_queue = control_queue
+        self._buffer: Optional[_FrameBuffer] = None
+        self._version = 0
+
+        # Limits for maybe_publish
+        self._min_interval = 1 / max_fps if max_fps else 0.0
+        self._last_publish_time = 0.0
+        self._last_publish_tick: Optional[int] = None
+
+        self._landscape: Optional[Landscape] = None
+
+        # Key each tree is published under, and its packed nodes as of the
+        # tree version they were packed from
+        self._tree_cache: weakref.WeakKeyDictionary[Tree, tuple[int, int, np.ndarray]] = (
+            weakref.WeakKeyDictionary()
+        )
+        self._next_tree_key = 0
+
+    def wants_frame(self) -> bool:
+        # True once the reader has copied out the last published frame
+        if self._buffer is None:
+            return True
+        header = self._buffer.header
+        return header[_FrameBuffer.HEADER_READ_SEQ] == header[_FrameBuffer.HEADER_SEQ]
+
+    def maybe_publish(
+        self,
+        environment: Environment,
+    ) -> bool:
+        # Publish only if the simulation has moved on, the reader is ready
+        # for another frame and max_fps allows it. Returns whether a frame
+        # was published.
+        if environment._num_ticks == self._last_publish_tick:
+            return False
+        now = time.perf_counter()
+        if now - self._last_publish_time < self._min_interval:
+            return False
+        if not self.wants_frame():
+            return False
+        self.publish(environment)
+        self._last_publish_time = now
+        return True
+
+    def publish(
+        self,
+        environment: Environment,
+    ) -> None:
+        start = time.perf_counter()
+        self._last_publish_tick = environment._num_ticks
+        self._publish_static(environment)
+
+        trees, nodes = self._pack_trees(environment)
+        particles = environment.particles
+        num_particles = len(particles)
+        self._reserve((len(trees), len(nodes), num_particles))
+
+        buffer = self._buffer
+        header = buffer.header
+        self._version += 1
+
+        # Odd sequence numbers mark a frame that is being written
+        header[_FrameBuffer.HEADER_SEQ] += 1
+        header[_FrameBuffer.HEADER_VERSION] = self._version
+        header[_FrameBuffer.HEADER_TICK] = environment._num_ticks
+        header[_FrameBuffer.HEADER_NUM_TREES] = len(trees)
+        header[_FrameBuffer.HEADER_NUM_NODES] = len(nodes)
+        header[_FrameBuffer.HEADER_NUM_PARTICLES] = num_particles
+        buffer.trees[:len(trees)] = trees
+        buffer.nodes[:len(nodes)] = nodes
+        buffer.particles[:num_particles, RenderFrame.PARTICLE_X] = particles.xs
+        buffer.particles[:num_particles, RenderFrame.PARTICLE_Y] = particles.ys
+        buffer.particles[:num_particles, RenderFrame.PARTICLE_TYPE] = particles.types
+        buffer.particles[:num_particles, RenderFrame.PARTICLE_POWER] = particles.powers
+        stats_start = _FrameBuffer.HEADER_STATS
+        header[stats_start:stats_start + len(RenderFrame.STATS)] = self._pack_stats(environment)
+        header[_FrameBuffer.HEADER_SEQ] += 1
+
+        environment.stats.record("publish", time.perf_counter() - start)
+
+    def _pack_stats(
+        self,
+        environment: Environment,
+    ) -> list[int]:
+        stats = environment.stats
+        return [
+            int(stats.mean("tick") * 1e6),
+            int(stats.mean("publish") * 1e6),
+            int(stats.ticks_per_sec),
+            int(stats.mean("live_particles")),
+            int(stats.mean("collision_tests")),
+            int(stats.mean("hits")),
+        ]
+
+    def close(self) -> None:
+        if self._buffer is not None:
+            segment = self._buffer.segment
+            self._buffer.release()
+            segment.unlink()
+            _owned_segments.discard(segment.name)
+            self._buffer = None
+
+    def _publish_static(
+        self,
+        environment: Environment,
+    ) -> None:
+        if environment._landscape is self._landscape:
+            return
+        self._landscape = environment._landscape
+        self._control_queue.put(("static", RenderStatic(
+            dims=environment._dims,
+            ground_levels=environment._landscape._ground_levels,
+        )))
+
+    def _reserve(
+        self,
+        sizes: tuple[int, int, int],
+    ) -> None:
+        if self._buffer is not None:
+            capacities = self._buffer.capacities()
+            if all(size <= capacity for size, capacity in zip(sizes, capacities)):
+                return
+            new_capacities = tuple(
+                max(size, capacity * 2)
+                for size, capacity in zip(sizes, capacities)
+            )
+        else:
+            new_capacities = tuple(max(size * 2, 64) for size in sizes)
+
+        # Move to a bigger segment and tell the renderer where it is. The
+        # renderer keeps its own mapping of the old one until it switches.
+        self.close()
+        segment = shared_memory.SharedMemory(
+            create=True,
+            size=_FrameBuffer.size_for(new_capacities),
+        )
+        self._buffer = _FrameBuffer(segment, new_capacities)
+        _owned_segments.add(segment.name)
+        self._control_queue.put(("segment", segment.name))
+
+    def _pack_trees(
+        self,
+        environment: Environment,
+    ) -> tuple[np.ndarray, np.ndarray]:
+        trees = np.zeros(
+            (len(environment._trees), RenderFrame.NUM_TREE_COLUMNS),
+            dtype=np.int64,
+        )
+        tree_nodes: list[np.ndarray] = []
+        num_nodes = 0
+        for index, tree in enumerate(environment._trees):
+            key, nodes = self._pack_tree(tree)
+            trees[index] = (
+                key,
+                tree._energy,
+                tree.bounds.topleft.x,
+                tree.bounds.topleft.y,
+                tree.bounds.botright.x,
+                tree.bounds.botright.y,
+                num_nodes,
+                len(nodes),
+                tree._version,
+            )
+            tree_nodes.append(nodes)
+            num_nodes += len(nodes)
+
+        if not tree_nodes:
+            return trees, np.zeros((0, RenderFrame.NUM_NODE_COLUMNS), dtype=np.int64)
+
+        # Parents are packed per tree; make them global
+        nodes = np.concatenate(tree_nodes)
+        node_offsets = np.repeat(
+            trees[:, RenderFrame.TREE_NODE_START],
+            trees[:, RenderFrame.TREE_NODE_COUNT],
+        )
+        has_parent = nodes[:, RenderFrame.NODE_PARENT] >= 0
+        nodes[has_parent, RenderFrame.NODE_PARENT] += node_offsets[has_parent]
+        return trees, nodes
+
+    def _pack_tree(
+        self,
+        tree: Tree,
+    ) -> tuple[int, np.ndarray]:
+        cached = self._tree_cache.get(tree)
+        if cached is not None and cached[1] == tree._version:
+            return cached[0], cached[2]
+
+        rows: list[tuple[int, int, int, int, int]] = []
+        stack = [(tree._root_node, -1)]
+        while stack:
+            node, parent = stack.pop()
+            rows.append((
+                node._pos.x,
+                node._pos.y,
+                node._size,
+                NODE_TYPE_CODES[node._type],
+                parent,
+            ))
+            index = len(rows) - 1
+            for child in reversed(node._children):
+                stack.append((child, index))
+
+        if cached is not None:
+            key = cached[0]
+        else:
+            key = self._next_tree_key
+            self._next_tree_key += 1
+        nodes = np.array(rows, dtype=np.int64)
+        self._tree_cache[tree] = (key, tree._version, nodes)
+        return key, nodes
+
+
+class FrameReader:
+
+    # Renderer side of the render channel
+
+    def __init__(
+        self,
+        control_queue: "multiprocessing.Queue[tuple]",
+    ) -> None:
+        self._control_queue = control_queue
+        self._buffer: Optional[_FrameBuffer] = None
+        self._last_seq = 0
+
+        self.static: Optional[RenderStatic] = None
+        self.frame: Optional[RenderFrame] = None
+
+    def poll(self) -> Optional[RenderFrame]:
+        # Returns a frame if one newer than the last has been published
+        self._poll_control()
+        if self._buffer is None:
+            return None
+
+        header = self._buffer.header
+        seq = int(header[_FrameBuffer.HEADER_SEQ])
+        if seq == self._last_seq or seq % 2 == 1:
+            return None
+
+        num_trees = int(header[_FrameBuffer.HEADER_NUM_TREES])
+        num_nodes = int(header[_FrameBuffer.HEADER_NUM_NODES])
+        num_particles = int(header[_FrameBuffer.HEADER_NUM_PARTICLES])
+        frame = RenderFrame(
+            version=int(header[_FrameBuffer.HEADER_VERSION]),
+            tick=int(header[_FrameBuffer.HEADER_TICK]),
+            trees=self._buffer.trees[:num_trees].copy(),
+            nodes=self._buffer.nodes[:num_nodes].copy(),
+            particles=self._buffer.particles[:num_particles].copy(),
+            stats=dict(zip(
+                RenderFrame.STATS,
+                header[_FrameBuffer.HEADER_STATS:].tolist(),
+            )),
+        )
+
+        # The frame was overwritten while copying; try again next poll
+        if int(header[_FrameBuffer.HEADER_SEQ]) != seq:
+            return None
+
+        self._last_seq = seq
+        header[_FrameBuffer.HEADER_READ_SEQ] = seq
+        self.frame = frame
+        return frame
+
+    def close(self) -> None:
+        if self._buffer is not None:
+            self._buffer.release()
+            self._buffer = None
+
+    def _poll_control(self) -> None:
+        while True:
+            try:
+                kind, payload = self._control_queue.get(block=False)
+            except queue.Empty:
+                return
+            if kind == "static":
+                self.static = payload
+            elif kind == "segment":
+                self._attach(payload)
+
+    def _attach(
+        self,
+        name: str,
+    ) -> None:
+        self.close()
+        try:
+            segment = shared_memory.SharedMemory(name=name)
+        except FileNotFoundError:
+            # Already replaced by a newer segment, which is announced later
+            return
+
+        # The publisher owns the segment; stop this process's resource
+        # tracker from unlinking it on exit
+        if name not in _owned_segments:
+            resource_tracker.unregister(segment._name, "shared_memory")
+
+        self._buffer = _FrameBuffer(segment)
+        self._last_seq = 0
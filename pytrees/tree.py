@@ -25,15 +25,14 @@
 
 from enum import Enum
 import math
-import random
-from typing import Optional
+from typing import Any, Optional
 
-import pygame
-from pytrees.display import PyTreesDisplay
+import numpy as np
 
-from pytrees.interfaces import Drawable
-import pytrees.mutation
-from pytrees.utils import Bounds, Pos, PyTreeColor, draw_text
+from pytrees.genome import TreeGenome
+from pytrees.mutation import MutationConfig
+from pytrees.rng import RandomStream
+from pytrees.utils import Bounds, Pos, PyTreeColor
 
 
 class TreeNodeType(Enum):
@@ -43,7 +42,12 @@ class TreeNodeType(Enum):
     WATERCATCHER = PyTreeColor.BLUE
 
 
-class TreeNode(Drawable):
+# Node types are stored in genomes and frames as their index in this list
+NODE_TYPES: list[TreeNodeType] = list(TreeNodeType)
+NODE_TYPE_CODES = {type: code for code, type in enumerate(NODE_TYPES)}
+
+
+class TreeNode:
 
     def __init__(
         self,
@@ -58,10 +62,12 @@ class TreeNode(Drawable):
         self._children: list[TreeNode] = []
 
         # Type
+        rng = owner._rng
+        config = owner._mutation
         if type:
             self._type = type
         else:
-            self._type = random.choice(list(TreeNodeType))
+            self._type = rng.choice(NODE_TYPES)
 
         # Position
         if pos:
@@ -71,11 +77,11 @@ class TreeNode(Drawable):
         else:
             if self._parent is None:
                 raise Exception("non-positioned node has no parent")
-            self._dist = random.random()*30.0 + pytrees.mutation.MIN_NODE_DISTANCE
-            self._angle = math.radians(random.random()*360.0)
+            self._dist = rng.random()*30.0 + config.MIN_NODE_DISTANCE
+            self._angle = math.radians(rng.random()*360.0)
             self.update_pos_absolute()
 
-        self._size = int(pytrees.mutation.MIN_NODE_SIZE) * 2
+        self._size = int(config.MIN_NODE_SIZE) * 2
 
     def add_child(
         self,
@@ -87,49 +93,7 @@ class TreeNode(Drawable):
             type=type,
             pos=None,
         ))
-
-    def draw(
-        self,
-        display: PyTreesDisplay,
-        offset: Optional[Pos] = None,
-    ) -> None:
-        if offset is None:
-            offset = display.offset
-
-        pygame.draw.circle(
-            surface=display.surface,
-            color=self._type.value.value,
-            center=(self._pos - offset).tuple(),
-            radius=self._size,
-        )
-        if display.debug:
-            pygame.draw.rect(
-                surface=display.surface,
-                color=PyTreeColor.BLACK.value,
-                rect=pygame.Rect(
-                    (self._pos - Pos(self._size, self._size) - offset).tuple(),
-                    Pos(self._size*2, self._size*2).tuple(),
-                ),
-                width=1,
-            )
-
-    def draw_recursive(
-        self,
-        display: PyTreesDisplay,
-        offset: Optional[Pos] = None,
-    ) -> None:
-        if offset is None:
-            offset = display.offset
-
-        for child in self._children:
-            pygame.draw.line(
-                surface=display.surface,
-                color=PyTreeColor.BLACK.value,
-                start_pos=(self._pos - offset).tuple(),
-                end_pos=(child._pos - offset).tuple(),
-            )
-            child.draw_recursive(display, offset)
-        self.draw(display, offset)
+        self._owner._dirty = True
 
     @classmethod
     def clone(
@@ -165,23 +129,6 @@ class TreeNode(Drawable):
         dist = math.sqrt(delta.x**2 + delta.y**2)
         return dist < self._size
 
-    def get_pos_extremes(
-        self,
-    ) -> tuple[Pos, Pos]:
-        topleft = self._pos - Pos(self._size, self._size)
-        bottomright = self._pos + Pos(self._size, self._size)
-        for child in self._children:
-            child_topleft, child_bottomright = child.get_pos_extremes()
-            if child_topleft.x < topleft.x:
-                topleft.x = child_topleft.x
-            if child_topleft.y < topleft.y:
-                topleft.y = child_topleft.y
-            if child_bottomright.x > bottomright.x:
-                bottomright.x = child_bottomright.x
-            if child_bottomright.y > bottomright.y:
-                bottomright.y = child_bottomright.y
-        return (topleft, bottomright)
-
     def get_children_recursively(
         self,
     ) -> set["TreeNode"]:
@@ -191,16 +138,21 @@ class TreeNode(Drawable):
         return ret
 
     def mutate(self):
+        # The tree's geometry has to be re-solved after any mutation
+        self._owner._dirty = True
+        rng = self._owner._rng
+        config = self._owner._mutation
+
         # Chance of changing this node's type
-        if random.random() < pytrees.mutation.CHANCE_NODE_TYPE:
-            new_type = random.choice(list(TreeNodeType))
+        if rng.random() < config.CHANCE_NODE_TYPE:
+            new_type = rng.choice(NODE_TYPES)
 
             # re-roll, to make it more likely that the root node is a struct node
             if (
                 new_type is not TreeNodeType.STRUCT and
-                random.random() < pytrees.mutation.CHANCE_NODE_TYPE_STRUCT
+                rng.random() < config.CHANCE_NODE_TYPE_STRUCT
             ):
-                new_type = random.choice(list(TreeNodeType))
+                new_type = rng.choice(NODE_TYPES)
 
             # if the new type is not a struct, remove all children
             if new_type is not TreeNodeType.STRUCT:
@@ -210,16 +162,16 @@ class TreeNode(Drawable):
             self._type = new_type
 
         # Chance of mutating this node's size
-        if random.random() < pytrees.mutation.CHANCE_NODE_SIZE:
-            size_inc = int(random.random() * 20.0 - 10.0)
+        if rng.random() < config.CHANCE_NODE_SIZE:
+            size_inc = int(rng.random() * 20.0 - 10.0)
             self._size += size_inc
-            if self._size < pytrees.mutation.MIN_NODE_SIZE:
-                self._size = pytrees.mutation.MIN_NODE_SIZE
+            if self._size < config.MIN_NODE_SIZE:
+                self._size = config.MIN_NODE_SIZE
 
         # For each child, chance of losing it. If not lost, mutate it
         remaining_children: list[TreeNode] = []
         for child in self._children:
-            if random.random() > pytrees.mutation.CHANCE_NODE_DELETE:
+            if rng.random() > config.CHANCE_NODE_DELETE:
                 remaining_children.append(child)
                 child.mutate()
         self._children = remaining_children
@@ -227,34 +179,42 @@ class TreeNode(Drawable):
         # Chance of adding child nodes, if this is a structure node
         while (
             self._type is TreeNodeType.STRUCT and
-            random.random() < pytrees.mutation.CHANCE_NODE_ADD
+            rng.random() < config.CHANCE_NODE_ADD
         ):
-            self.add_child(random.choice(list(TreeNodeType)))
+            self.add_child(rng.choice(NODE_TYPES))
 
         # Chance to mutate angle between this node and its parent
-        if random.random() < pytrees.mutation.CHANCE_NODE_ANGLE:
-            angle_inc = random.random() * 30.0 - 15
+        if rng.random() < config.CHANCE_NODE_ANGLE:
+            angle_inc = rng.random() * 30.0 - 15
             self._angle += angle_inc
             self.update_pos_absolute()
 
         # Chance of changing this node's distance from its parent
-        if random.random() < pytrees.mutation.CHANCE_NODE_DISTANCE:
-            distInc = random.random() * 30.0 - 15
+        if rng.random() < config.CHANCE_NODE_DISTANCE:
+            distInc = rng.random() * 30.0 - 15
             self._dist += distInc
 
             # Check for minimum distance
-            if self._dist < pytrees.mutation.MIN_NODE_DISTANCE:
-                self._dist = pytrees.mutation.MIN_NODE_DISTANCE
+            if self._dist < config.MIN_NODE_DISTANCE:
+                self._dist = config.MIN_NODE_DISTANCE
 
             self.update_pos_absolute()
 
 
-class Tree(Drawable):
+class Tree:
 
     def __init__(
         self,
         root: Pos,
+        genome: Optional[TreeGenome] = None,
+        rng: Optional[RandomStream] = None,
+        mutation: Optional[MutationConfig] = None,
     ) -> None:
+        # Stream that node creation and mutation draw from, and the chances
+        # and limits they use
+        self._rng = rng if rng is not None else RandomStream()
+        self._mutation = mutation if mutation is not None else MutationConfig()
+
         self._fitness = 0
         self._nutrients = 0
         self._energy = 0
@@ -262,39 +222,118 @@ class Tree(Drawable):
 
         self._age = 0
 
-        self._root_node = TreeNode(
-            owner=self,
-            parent=None,
-            type=TreeNodeType.STRUCT,
-            pos=root,
-        )
-        self._root_node.mutate()
+        # Incremented every time the tree's geometry is re-solved
+        self._version = 0
+        self._dirty = False
 
-        self.bounds = Bounds(*self._root_node.get_pos_extremes())
-        self._nodes: set[TreeNode] = self._root_node.get_children_recursively()
+        if genome is None:
+            self._root_node = TreeNode(
+                owner=self,
+                parent=None,
+                type=TreeNodeType.STRUCT,
+                pos=root,
+            )
+            self._root_node.mutate()
+        else:
+            self._root_node = self._build_nodes(genome, root)
+
+        self.bounds: Bounds
+        self._nodes: set[TreeNode]
+        self.solve()
+
+    def solve(self) -> None:
+        # Recompute every node's absolute position from the root in one
+        # vectorized pass, then refresh the bounds and node set to match
+        nodes, genome = self._flatten()
+        xs, ys = genome.positions(self._root_node._pos)
+        for node, x, y in zip(nodes[1:], xs[1:].tolist(), ys[1:].tolist()):
+            node._pos = Pos(x, y)
+
+        sizes = genome.sizes.astype(np.int64)
+        self.bounds = Bounds(
+            Pos(int((xs - sizes).min()), int((ys - sizes).min())),
+            Pos(int((xs + sizes).max()), int((ys + sizes).max())),
+        )
+        self._nodes = set(nodes)
+        self._dirty = False
+        self._version += 1
+
+    def genome(self) -> TreeGenome:
+        return self._flatten()[1]
+
+    def _flatten(self) -> tuple[list["TreeNode"], TreeGenome]:
+        # Walk the node graph in pre-order
+        nodes: list[TreeNode] = []
+        parents: list[int] = []
+        stack: list[tuple[TreeNode, int]] = [(self._root_node, -1)]
+        while stack:
+            node, parent = stack.pop()
+            nodes.append(node)
+            parents.append(parent)
+            index = len(nodes) - 1
+            for child in reversed(node._children):
+                stack.append((child, index))
+
+        return nodes, TreeGenome(
+            parents=np.array(parents),
+            types=np.array([NODE_TYPE_CODES[node._type] for node in nodes]),
+            angles=np.array([node._angle for node in nodes]),
+            dists=np.array([node._dist for node in nodes]),
+            sizes=np.array([node._size for node in nodes]),
+        )
 
-    def draw(
+    def _build_nodes(
         self,
-        display: PyTreesDisplay,
-        offset: Optional[Pos] = None,
-    ) -> None:
-        if offset is None:
-            offset = display.offset
-
-        self._root_node.draw_recursive(display, offset)
-        if display.debug:
-            pygame.draw.rect(
-                surface=display.surface,
-                color=PyTreeColor.BLACK.value,
-                rect=pygame.Rect(
-                    (self.bounds.topleft - offset).tuple(),
-                    (self.bounds.botright - self.bounds.topleft).tuple(),
-                ),
-                width=1,
-            )
-            draw_text(
-                surface=display.surface,
-                left_top=(self.bounds.topleft - offset),
-                text=str(self._energy),
-                fontsize=10,
+        genome: TreeGenome,
+        root: Pos,
+    ) -> TreeNode:
+        # Rebuild the node graph from a genome, placing every node in one
+        # vectorized pass. Nodes are created with their position given, so
+        # nothing here draws random numbers.
+        xs, ys = genome.positions(root)
+        nodes: list[TreeNode] = []
+        for i, (parent, type, angle, dist, size, x, y) in enumerate(zip(
+            genome.parents.tolist(),
+            genome.types.tolist(),
+            genome.angles.tolist(),
+            genome.dists.tolist(),
+            genome.sizes.tolist(),
+            xs.tolist(),
+            ys.tolist(),
+        )):
+            parent_node = nodes[parent] if parent >= 0 else None
+            node = TreeNode(
+                owner=self,
+                parent=parent_node,
+                type=NODE_TYPES[type],
+                pos=root if i == 0 else Pos(x, y),
             )
+            node._angle = angle
+            node._dist = dist
+            node._size = size
+            if parent_node is not None:
+                parent_node._children.append(node)
+            nodes.append(node)
+        return nodes[0]
+
+    # Pickle trees as their genome rather than as a graph of nodes with
+    # back-references. The random stream is kept, so trees pickled with
+    # their environment still share its tree stream.
+    def __getstate__(self) -> dict[str, Any]:
+        state = self.__dict__.copy()
+        state["_root_pos"] = self._root_node._pos
+        state["_genome"] = self.genome()
+        del state["_root_node"]
+        del state["_nodes"]
+        return state
+
+    def __setstate__(
+        self,
+        state: dict[str, Any],
+    ) -> None:
+        root = state.pop("_root_pos")
+        genome = state.pop("_genome")
+        self.__dict__.update(state)
+        self._root_node = self._build_nodes(genome, root)
+        self._nodes = self._root_node.get_children_recursively()
+        self._dirty = False
@@ -25,9 +25,6 @@
 
 from enum import Enum
 
-from pygame import Color, Surface
-import pygame
-
 
 DEBUG = True
 
@@ -47,13 +44,29 @@ class PyTreeColor(Enum):
 
 class Pos:
 
+    # Immutable, so a Pos can be shared freely and used as a dict key or set
+    # member without its hash changing underneath the container
+    __slots__ = ("x", "y")
+
+    x: int
+    y: int
+
     def __init__(
         self,
         x: int,
         y: int,
     ) -> None:
-        self.x = x
-        self.y = y
+        _set_x(self, x)
+        _set_y(self, y)
+
+    def __setattr__(self, name: str, value: object) -> None:
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    def __delattr__(self, name: str) -> None:
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    def __reduce__(self) -> tuple:
+        return (type(self), (self.x, self.y))
 
     # Equality
     def __eq__(self, __value: object) -> bool:
@@ -80,7 +93,7 @@ class Pos:
 
     # Meta
     def __hash__(self) -> int:
-        return hash(repr(self))
+        return hash((self.x, self.y))
 
     def __repr__(self) -> str:
         return f"({self.x},{self.y})"
@@ -90,18 +103,52 @@ class Pos:
         return (self.x, self.y)
 
 
+# Slot setters, which bypass the immutability guard in __setattr__ and are
+# much cheaper to call than object.__setattr__
+_set_x = Pos.x.__set__  # type: ignore[attr-defined]
+_set_y = Pos.y.__set__  # type: ignore[attr-defined]
+
+
 Dims = Pos
 
 
 class Bounds:
 
+    # Immutable like Pos
+    __slots__ = ("topleft", "botright")
+
+    topleft: Pos
+    botright: Pos
+
     def __init__(
         self,
         topleft: Pos,
         botright: Pos,
     ) -> None:
-        self.topleft = topleft
-        self.botright = botright
+        _set_topleft(self, topleft)
+        _set_botright(self, botright)
+
+    def __setattr__(self, name: str, value: object) -> None:
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    def __delattr__(self, name: str) -> None:
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    def __reduce__(self) -> tuple:
+        return (type(self), (self.topleft, self.botright))
+
+    # Equality
+    def __eq__(self, __value: object) -> bool:
+        if type(__value) is Bounds:
+            return self.topleft == __value.topleft and self.botright == __value.botright
+        else:
+            return False
+
+    def __hash__(self) -> int:
+        return hash((self.topleft, self.botright))
+
+    def __repr__(self) -> str:
+        return f"[{self.topleft},{self.botright}]"
 
     def contains(
         self,
@@ -113,30 +160,5 @@ class Bounds:
         )
 
 
-# Dict for cacheing existing fonts of a size
-font_dict: dict[int, pygame.font.Font] = {}
-
-
-def draw_text(
-    surface: Surface,
-    left_top: Pos,
-    text: str,
-    fontsize: int,
-    color: PyTreeColor = PyTreeColor.BLACK,
-):
-    # Create a font if one does not yet exist
-    if fontsize not in font_dict:
-        font_dict[fontsize] = pygame.font.Font('freesansbold.ttf', fontsize)
-    font = font_dict[fontsize]
-
-    # Render some text on a new surface
-    text_surface = font.render(text, True, color.value)
-
-    # Get the rectangular bounds of the text surface
-    text_surface_bounds = text_surface.get_rect()
-
-    # Set an anchor for this text surface's bounds
-    text_surface_bounds.topleft = left_top.tuple()
-
-    # Copy the text surface to the main surface
-    surface.blit(text_surface, text_surface_bounds)
+_set_topleft = Bounds.topleft.__set__  # type: ignore[attr-defined]
+_set_botright = Bounds.botright.__set__  # type: ignore[attr-defined]
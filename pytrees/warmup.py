@@ -0,0 +1,178 @@
+#############################################################################
+# MIT License
+
+# Copyright (c) 2023-2024 Chris Urffer
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#############################################################################
+
+
+# Cache of warmed-up particle fields. Before any trees exist, an
+# environment's particles depend only on its size, seed, spawn rate and
+# number of warmup ticks, so environments that share those can share one
+# warmup. Set Environment.warmup_cache to use one:
+#
+#   Environment.warmup_cache = WarmupCache("warmups/")
+#
+# Fields are kept in memory, least recently used first out, and optionally
+# written to a directory in the checkpoint format, where other processes
+# and later runs load them through a memory map.
+
+from collections import OrderedDict
+import hashlib
+import os
+from typing import Any, Optional
+
+import numpy as np
+
+from pytrees.checkpoint import CheckpointError, CheckpointReader, write_checkpoint
+from pytrees.environment import Environment
+
+
+# Particle columns stored for every warmed-up particle
+_COLUMNS = ("ids", "births", "xs", "types")
+
+_Snapshot = tuple[dict[str, Any], dict[str, np.ndarray]]
+
+
+class WarmupCache:
+
+    MAX_ENTRIES = 32
+
+    def __init__(
+        self,
+        directory: Optional[str] = None,
+        max_entries: int = MAX_ENTRIES,
+    ) -> None:
+        self._directory = directory
+        self._max_entries = max_entries
+        self._entries: OrderedDict[tuple, _Snapshot] = OrderedDict()
+
+        self.num_hits = 0
+        self.num_misses = 0
+
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @staticmethod
+    def key(
+        environment: Environment,
+        num_ticks: int,
+    ) -> tuple:
+        # The landscape and particle streams fix the field. They are keyed
+        # themselves rather than the environment's seed, since the same
+        # SeedSequence spawns different streams each time it is used.
+        landscape_seed = environment._landscape_rng._seed_sequence
+        particle_seed = environment._particle_rng._seed_sequence
+        return (
+            environment.WIDTH,
+            environment.HEIGHT,
+            landscape_seed.entropy,
+            tuple(landscape_seed.spawn_key),
+            particle_seed.entropy,
+            tuple(particle_seed.spawn_key),
+            environment.NUM_PARTICLES_PER_TICK,
+            num_ticks,
+        )
+
+    def _path(
+        self,
+        key: tuple,
+    ) -> str:
+        assert self._directory is not None
+        digest = hashlib.sha256(repr(key).encode()).hexdigest()[:32]
+        return os.path.join(self._directory, f"{digest}.warmup")
+
+    def load(
+        self,
+        environment: Environment,
+        num_ticks: int,
+    ) -> bool:
+        # Fill a new environment's particles from the cache. Returns whether
+        # the field was cached.
+        key = self.key(environment, num_ticks)
+        snapshot = self._entries.get(key)
+        if snapshot is not None:
+            self._entries.move_to_end(key)
+        elif self._directory is not None and os.path.exists(self._path(key)):
+            try:
+                with CheckpointReader(self._path(key)) as reader:
+                    if reader.meta.get("key") == repr(key):
+                        snapshot = (
+                            reader.meta,
+                            {name: np.array(reader.array(name)) for name in reader.names()},
+                        )
+            except (CheckpointError, OSError, ValueError, KeyError):
+                snapshot = None
+            if snapshot is not None:
+                self._remember(key, snapshot)
+
+        if snapshot is None:
+            self.num_misses += 1
+            return False
+        self.num_hits += 1
+
+        meta, arrays = snapshot
+        particles = environment._particles
+        particles.append(*(arrays[name] for name in _COLUMNS), meta["num_ticks"])
+        particles._next_id = meta["next_particle_id"]
+        environment._num_ticks = meta["num_ticks"]
+        environment._particle_rng.set_state({
+            **meta["stream"],
+            "buffer": arrays["stream_buffer"],
+        })
+        return True
+
+    def save(
+        self,
+        environment: Environment,
+        num_ticks: int,
+    ) -> None:
+        # Cache a freshly warmed-up environment's particles
+        key = self.key(environment, num_ticks)
+        particles = environment._particles
+        stream = environment._particle_rng.get_state()
+        arrays = {name: getattr(particles, name).copy() for name in _COLUMNS}
+        arrays["stream_buffer"] = stream.pop("buffer")
+        meta = {
+            "key": repr(key),
+            "num_ticks": environment._num_ticks,
+            "next_particle_id": particles._next_id,
+            "stream": stream,
+        }
+        self._remember(key, (meta, arrays))
+        if self._directory is not None:
+            write_checkpoint(self._path(key), meta, arrays)
+
+    def _remember(
+        self,
+        key: tuple,
+        snapshot: _Snapshot,
+    ) -> None:
+        self._entries[key] = snapshot
+        self._entries.move_to_end(key)
+        while len(self._entries) > self._max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        # Only forgets the in-memory fields; files stay on disk
+        self._entries.clear()